@@ -0,0 +1,77 @@
+"""
+消息元素内存占用对比：分别以pydantic模型和紧凑表示持有大量元素，用tracemalloc计算每个元素的字节数
+
+    python bench/compact_bench.py --count 100000 -o result.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cah.message.chain import MessageChain, trusted_model  # noqa: E402
+from cah.message.compact import compact_model  # noqa: E402
+
+SAMPLES = [
+    {"type": "Source", "id": 123456, "time": 1600000000},
+    {"type": "Plain", "text": "老阿姨"},
+    {"type": "At", "target": 10000},
+    {"type": "AtAll"},
+    {"type": "Face", "faceId": 1, "name": "撇嘴"},
+    {"type": "Image", "imageId": "{01E9451B-70ED-EAE3-B37C-101F1EEBF5B5}.jpg", "url": "https://example.com/1.jpg"},
+    {"type": "FlashImage", "imageId": "{01E9451B-70ED-EAE3-B37C-101F1EEBF5B5}.jpg"},
+    {"type": "Voice", "voiceId": "23C4B3A7.amr", "length": 3},
+    {"type": "Dice", "value": 6}
+]
+
+
+def measure(count: int, build: Callable[[int], object]) -> dict:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    held: List[object] = [build(i) for i in range(count)]
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del held
+    return {"bytes_per_element": round(size / count, 1), "build_us": round(elapsed / count * 1e6, 3)}
+
+
+def run(args) -> dict:
+    result = {"python": sys.version.split()[0], "count": args.count, "elements": {}}
+    for sample in SAMPLES:
+        name = sample["type"]
+        # 每个实例各自持有一份字段值，避免共享对象让两边的差距失真
+        data = lambda i: {k: (f"{v}{i}" if isinstance(v, str) and k != "type" else v) for k, v in sample.items()}
+        compact_cls = compact_model[name]
+        result["elements"][name] = {
+            "validated": measure(args.count, lambda i: compact_cls.model.parse_obj(data(i))),
+            "trusted": measure(args.count, lambda i: trusted_model[name](data(i))),
+            "compact": measure(args.count, lambda i: compact_cls.from_dict(data(i)))
+        }
+    chains = [dict(sample) for sample in SAMPLES]
+    result["chain"] = {
+        "model": measure(args.count // 10, lambda i: MessageChain.trusted(chains)),
+        "compact": measure(args.count // 10, lambda i: MessageChain.trusted(chains).compact())
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("-o", "--output", default=None)
+    args = parser.parse_args()
+    result = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(result)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
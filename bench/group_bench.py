@@ -0,0 +1,84 @@
+"""
+群成员列表解码的内存占用：对比共享Group实例(interning)和每个成员各自一份Group，用tracemalloc统计
+
+    python bench/group_bench.py --members 3000 --groups 20 -o result.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cah.component.group import GroupMemberList, interned_groups  # noqa: E402
+from cah.message.type import MessageType  # noqa: E402
+
+
+def member_list(group_id: int, members: int) -> list:
+    group = {"id": group_id, "name": f"群{group_id}", "permission": "MEMBER"}
+    return [
+        {
+            "id": 100000 + i,
+            "memberName": f"成员{i}",
+            "specialTitle": "",
+            "joinTimestamp": 1600000000 + i,
+            "lastSpeakTimestamp": 1600000000 + i,
+            "muteTimeRemaining": 0,
+            "permission": "MEMBER",
+            "group": dict(group)
+        }
+        for i in range(members)
+    ]
+
+
+def group_message(member: dict) -> dict:
+    return {"type": "GroupMessage", "messageChain": [{"type": "Plain", "text": "老阿姨"}], "sender": member}
+
+
+def measure(build) -> dict:
+    interned_groups.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return {"bytes": size, "seconds": round(elapsed, 4)}
+
+
+def run(args) -> dict:
+    raw = [member_list(group_id, args.members) for group_id in range(args.groups)]
+    messages = [group_message(member) for members in raw for member in members[:args.messages]]
+    result = {"python": sys.version.split()[0], "members": args.members, "groups": args.groups}
+    for name, enabled in (("copied", False), ("interned", True)):
+        interned_groups.enabled = enabled
+        lists = measure(lambda: [GroupMemberList.parse_obj(members) for members in raw])
+        sends = measure(lambda: [MessageType.to_message("GroupMessage", data) for data in messages])
+        total = args.members * args.groups
+        result[name] = {
+            "member_list": dict(lists, bytes_per_member=round(lists["bytes"] / total, 1)),
+            "group_message": dict(sends, bytes_per_message=round(sends["bytes"] / len(messages), 1))
+        }
+    interned_groups.enabled = True
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=3000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=100, help="每个群模拟的GroupMessage条数")
+    parser.add_argument("-o", "--output", default=None)
+    args = parser.parse_args()
+    result = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(result)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
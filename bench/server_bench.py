@@ -0,0 +1,183 @@
+"""
+MainServer压测：在进程内启动服务端，用本地WebSocket客户端驱动，结果以JSON输出
+
+    python bench/server_bench.py --messages 20000 --commands 2000 --clients 1,2,4,8 -o result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+import tracemalloc
+from typing import List
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cah.server import MainServer  # noqa: E402
+
+QQ = 10000
+VERIFY_KEY = "bench"
+GROUP_MESSAGE = {
+    "syncId": "-1",
+    "data": {
+        "type": "GroupMessage",
+        "messageChain": [{"type": "Plain", "text": "老阿姨"}],
+        "sender": {
+            "id": 1,
+            "memberName": "?",
+            "permission": "MEMBER",
+            "group": {
+                "id": 2,
+                "name": "??",
+                "permission": "MEMBER"
+            }
+        }
+    }
+}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * pct / 100), len(samples) - 1)]
+
+
+class Bench:
+    def __init__(self, server: MainServer, port: int, session: aiohttp.ClientSession):
+        self.server = server
+        self.url = f"http://127.0.0.1:{port}/all?qq={QQ}&verifyKey={VERIFY_KEY}"
+        self.session = session
+
+    async def connect(self):
+        ws = await self.session.ws_connect(self.url, max_msg_size=0)
+        key = (await ws.receive_json())["data"]["session"]
+        return ws, key
+
+    @staticmethod
+    async def drain(ws: aiohttp.ClientWebSocketResponse, count: int):
+        received = 0
+        while received < count:
+            msg = await ws.receive()
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            received += 1
+        return received
+
+    async def push(self, count: int, clients: int) -> dict:
+        conns = [await self.connect() for _ in range(clients)]
+        readers = [asyncio.create_task(self.drain(ws, count)) for ws, _ in conns]
+        cpu, wall = time.process_time(), time.perf_counter()
+        for i in range(count):
+            await self.server.emit(QQ, GROUP_MESSAGE)
+            if not i % 256:
+                await asyncio.sleep(0)
+        received = sum(await asyncio.gather(*readers))
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        for ws, _ in conns:
+            await ws.close()
+        return {
+            "clients": clients,
+            "messages": count,
+            "delivered": received,
+            "seconds": wall,
+            "msgs_per_sec": count / wall,
+            "deliveries_per_sec": received / wall,
+            "cpu_us_per_delivery": cpu / max(received, 1) * 1e6
+        }
+
+    async def round_trip(self, count: int) -> dict:
+        ws, key = await self.connect()
+        latencies = []
+        for i in range(count):
+            start = time.perf_counter()
+            await ws.send_str(json.dumps({
+                "syncId": str(i),
+                "command": "sendGroupMessage",
+                "content": {
+                    "sessionKey": key,
+                    "target": 2,
+                    "messageChain": [{"type": "Plain", "text": "bench"}]
+                }
+            }))
+            while (await ws.receive_json())["syncId"] != str(i):
+                pass
+            latencies.append((time.perf_counter() - start) * 1e6)
+        await ws.close()
+        return {
+            "commands": count,
+            "p50_us": percentile(latencies, 50),
+            "p90_us": percentile(latencies, 90),
+            "p99_us": percentile(latencies, 99),
+            "max_us": max(latencies)
+        }
+
+    async def allocations(self, count: int) -> dict:
+        ws, _ = await self.connect()
+        reader = asyncio.create_task(self.drain(ws, count))
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for i in range(count):
+            await self.server.emit(QQ, GROUP_MESSAGE)
+            if not i % 256:
+                await asyncio.sleep(0)
+        await reader
+        _, peak = tracemalloc.get_traced_memory()
+        retained = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+        tracemalloc.stop()
+        await ws.close()
+        return {
+            "messages": count,
+            "peak_bytes": peak,
+            "peak_bytes_per_message": peak / count,
+            "retained_bytes": retained
+        }
+
+
+async def run(args) -> dict:
+    server = MainServer(None, verify_key=VERIFY_KEY, codec=args.codec, queue_size=args.messages)
+    server.register()
+    runner = web.AppRunner(server.app)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    site = web.SockSite(runner, sock)
+    await site.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            bench = Bench(server, sock.getsockname()[1], session)
+            return {
+                "codec": server.codec.name,
+                "python": sys.version.split()[0],
+                "push": await bench.push(args.messages, 1),
+                "round_trip": await bench.round_trip(args.commands),
+                "fan_out": [await bench.push(args.messages, n) for n in args.clients],
+                "allocations": await bench.allocations(args.alloc_messages)
+            }
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--alloc-messages", type=int, default=2000)
+    parser.add_argument("--clients", type=lambda v: [int(i) for i in v.split(",")], default=[1, 2, 4, 8, 16])
+    parser.add_argument("--codec", default=None)
+    parser.add_argument("-o", "--output", default=None)
+    args = parser.parse_args()
+    result = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(result)
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
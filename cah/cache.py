@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from .encoder import dump_model
+from .journal import Journal, KIND_EVENT, KIND_MESSAGE
+from .message.chain import CacheMessage, MessageChain
+from .message.models import Source
+
+# 自己发出的消息从这里开始编号，不会和QQ的Source.id(int32)冲突
+SENT_BASE = 1 << 32
+
+
+class MessageCache:
+    """
+    单个bot的消息缓存，按条数和编码后的总字节数限制容量，超出时按LRU淘汰；
+    所有消息都按Source.id索引：收到的消息用自带的Source，
+    自己发出的消息分配SENT_BASE之后的id并作为Source写入消息链。
+    配置journal时消息以Source.id为key写入，未命中的查询按key回落到journal，重启后同样可查；
+    推送的消息由server以事件帧写入journal(同样以Source.id为key)，再通过remember放入缓存，不重复编码
+    """
+
+    def __init__(
+            self,
+            max_entries: int = 4096,
+            max_bytes: int = 16 * 1024 * 1024,
+            journal: Optional[Journal] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.journal = journal
+        self.size = 0
+        self._next_id = 1
+        self._store: "OrderedDict[int, Tuple[CacheMessage, int]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._store)
+
+    def __contains__(self, message_id: int):
+        return self.get(message_id) is not None
+
+    def put(self, message: CacheMessage) -> int:
+        """
+        缓存自己发出的消息，返回分配的消息id
+        """
+        if self.journal:
+            # 有journal时id跟随记录id，重启后也不会重复
+            message_id = SENT_BASE + self.journal.next_id
+        else:
+            message_id = SENT_BASE + self._next_id
+            self._next_id += 1
+        chain = message.messageChain
+        message = CacheMessage.construct(
+            type=message.type,
+            messageChain=MessageChain.construct(__root__=[Source(message_id, int(time.time())), *chain])
+        )
+        data = dump_model(message).encode()
+        if self.journal:
+            self.journal.append(KIND_MESSAGE, data, message_id)
+        self.remember(message_id, message, len(data))
+        return message_id
+
+    def add(self, message: CacheMessage, size: Optional[int] = None) -> Optional[int]:
+        """
+        缓存收到的消息，按其Source.id索引；没有Source的消息无法被引用，不缓存
+        """
+        source = message.messageChain.get_source() if message.messageChain else None
+        if source is None:
+            return None
+        data = dump_model(message).encode() if self.journal or size is None else None
+        if self.journal:
+            self.journal.append(KIND_MESSAGE, data, source.id)
+        self.remember(source.id, message, len(data) if size is None else size)
+        return source.id
+
+    def get(self, message_id: int) -> Optional[CacheMessage]:
+        entry = self._store.get(message_id)
+        if entry:
+            self._store.move_to_end(message_id)
+            return entry[0]
+        elif self.journal:
+            record = self.journal.find(message_id)
+            if record and record[0] == KIND_MESSAGE:
+                return CacheMessage.trusted(self.journal.codec.loads(record[1]))
+            elif record and record[0] == KIND_EVENT:
+                return CacheMessage.trusted(self.journal.codec.loads(record[1])["data"])
+
+    def remember(self, message_id: int, message: CacheMessage, size: int):
+        """
+        只放入内存，不写journal；size由调用方给出(例如已经编码好的推送帧的字节数)
+        """
+        previous = self._store.pop(message_id, None)
+        if previous:
+            self.size -= previous[1]
+        self._store[message_id] = (message, size)
+        self.size += size
+        store = self._store
+        while store and (len(store) > self.max_entries or self.size > self.max_bytes):
+            self.size -= store.popitem(last=False)[1][1]
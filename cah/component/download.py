@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import List, Optional, Set, Tuple
+
+import aiohttp
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class FileMismatchError(DownloadError):
+    def __init__(self, path: str, expected: str, actual: str):
+        super(FileMismatchError, self).__init__(path, expected, actual)
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self):
+        return f"{self.path}: sha1 {self.actual} does not match {self.expected}"
+
+
+class DownloadManager:
+    """
+    群文件下载：所有下载共用一个并发上限(按HTTP请求计)，支持Range的大文件按part_size分段并行拉取。
+    下载中的数据写在<save_path>.part，url、大小和已完成的分段记录在<save_path>.part.json，
+    失败时保留以便续传，两者不一致时从头下载；
+    写盘和sha1都在executor中进行，校验通过的结果按sha1缓存
+    """
+
+    def __init__(
+            self,
+            concurrency: int = 4,
+            part_size: int = 4 * 1024 * 1024,
+            split_threshold: int = 8 * 1024 * 1024,
+            executor: Optional[Executor] = None,
+            session: Optional[aiohttp.ClientSession] = None,
+            cache_size: int = 1024
+    ):
+        self.part_size = part_size
+        self.split_threshold = split_threshold
+        self.cache_size = cache_size
+        self._executor = executor
+        self._session = session
+        self._own_session = session is None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # sha1 -> (path, size, mtime_ns)
+        self._verified: "OrderedDict[str, Tuple[str, int, int]]" = OrderedDict()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._own_session and self._session:
+            await self._session.close()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def verified(self, sha1: str, path: str) -> bool:
+        entry = self._verified.get(sha1.lower())
+        if entry is None or entry[0] != os.path.abspath(path):
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime_ns) != entry[1:]:
+            return False
+        self._verified.move_to_end(sha1.lower())
+        return True
+
+    def _remember(self, sha1: str, path: str):
+        stat = os.stat(path)
+        self._verified[sha1.lower()] = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        self._verified.move_to_end(sha1.lower())
+        while len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+
+    async def _probe(self, url: str) -> Tuple[Optional[int], bool]:
+        async with self._semaphore:
+            async with self.session.head(url, allow_redirects=True) as resp:
+                resp.raise_for_status()
+                return resp.content_length, resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+    async def download(self, url: str, save_path: str, sha1: Optional[str] = None) -> str:
+        """
+        :param sha1: 给出时校验下载结果，不一致时抛出FileMismatchError并丢弃已下载的数据
+        """
+        if sha1 and self.verified(sha1, save_path):
+            return save_path
+        part = save_path + ".part"
+        try:
+            size, ranges = await self._probe(url)
+        except aiohttp.ClientResponseError:
+            size, ranges = None, False
+        if size is not None and ranges and size >= self.split_threshold:
+            await self._fetch_split(url, part, size)
+        else:
+            await self._fetch_stream(url, part, size, ranges)
+        if sha1:
+            actual = await self._run(self._hash, part)
+            if actual != sha1.lower():
+                self._discard(part)
+                raise FileMismatchError(save_path, sha1.lower(), actual)
+        os.replace(part, save_path)
+        self._discard_state(part)
+        if sha1:
+            self._remember(sha1, save_path)
+        return save_path
+
+    async def _fetch_stream(self, url: str, part: str, size: Optional[int], ranges: bool):
+        state_path = part + ".json"
+        offset = 0
+        # 只有url和大小都和上次一致时才续传
+        if ranges and os.path.exists(part) and self._load_state(state_path, url, size, "stream") is not None:
+            offset = os.path.getsize(part)
+            if size is not None and offset > size:
+                offset = 0
+        await self._run(self._save_state, state_path, url, size, [], "stream")
+        async with self._semaphore:
+            for _ in range(2):
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+                async with self.session.get(url, headers=headers) as resp:
+                    if resp.status == 416:
+                        if size is not None and offset == size:
+                            return
+                        offset = 0
+                        continue
+                    resp.raise_for_status()
+                    if resp.status == 206 and self._range_start(resp) != offset:
+                        offset = 0
+                        continue
+                    if resp.status != 206:
+                        offset = 0
+                    await self._write_stream(resp, part, offset, size)
+                    return
+            raise DownloadError(f"cannot resume download: {url}")
+
+    async def _write_stream(self, resp: aiohttp.ClientResponse, part: str, offset: int, size: Optional[int]):
+        fd = await self._run(os.open, part, os.O_WRONLY | os.O_CREAT)
+        try:
+            await self._run(os.ftruncate, fd, offset)
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                await self._run(os.pwrite, fd, chunk, offset)
+                offset += len(chunk)
+        finally:
+            await self._run(os.close, fd)
+        if size is not None and offset != size:
+            raise DownloadError(f"expected {size} bytes, got {offset}: {resp.url}")
+
+    @staticmethod
+    def _range_start(resp: aiohttp.ClientResponse) -> Optional[int]:
+        # Content-Range: bytes <start>-<end>/<total>
+        value = resp.headers.get("Content-Range", "")
+        unit, _, spec = value.partition(" ")
+        start = spec.partition("-")[0]
+        return int(start) if unit == "bytes" and start.isdigit() else None
+
+    async def _fetch_split(self, url: str, part: str, size: int):
+        state_path = part + ".json"
+        done = (self._load_state(state_path, url, size, "split") if os.path.exists(part) else None) or set()
+        fd = await self._run(os.open, part, os.O_WRONLY | os.O_CREAT)
+        try:
+            await self._run(os.ftruncate, fd, size)
+            pending: List[Tuple[int, int, int]] = [
+                (index, start, min(start + self.part_size, size) - 1)
+                for index, start in enumerate(range(0, size, self.part_size)) if index not in done
+            ]
+
+            async def fetch(index: int, start: int, end: int):
+                await self._fetch_range(url, fd, start, end)
+                done.add(index)
+                await self._run(self._save_state, state_path, url, size, sorted(done), "split")
+
+            # 等所有分段结束再关闭fd，成功的分段记录下来供续传
+            for result in await asyncio.gather(*(fetch(*item) for item in pending), return_exceptions=True):
+                if isinstance(result, BaseException):
+                    raise result
+        finally:
+            await self._run(os.close, fd)
+
+    async def _fetch_range(self, url: str, fd: int, start: int, end: int):
+        async with self._semaphore:
+            async with self.session.get(url, headers={"Range": f"bytes={start}-{end}"}) as resp:
+                resp.raise_for_status()
+                if resp.status != 206:
+                    raise DownloadError(f"range request not honored: {url}")
+                offset = start
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    await self._run(os.pwrite, fd, chunk, offset)
+                    offset += len(chunk)
+                if offset != end + 1:
+                    raise DownloadError(f"short read for bytes {start}-{end}: {url}")
+
+    @staticmethod
+    def _load_state(path: str, url: str, size: Optional[int], mode: str) -> Optional[Set[int]]:
+        """
+        状态文件和本次下载的url、大小、方式一致时返回已完成的分段，否则返回None
+        """
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != url or state.get("size") != size or state.get("mode") != mode:
+            return None
+        return set(state.get("done", ()))
+
+    @staticmethod
+    def _save_state(path: str, url: str, size: Optional[int], done: List[int], mode: str):
+        with open(path + ".tmp", "w") as f:
+            json.dump({"url": url, "size": size, "mode": mode, "done": done}, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _hash(path: str) -> str:
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    @staticmethod
+    def _discard_state(part: str):
+        if os.path.exists(part + ".json"):
+            os.remove(part + ".json")
+
+    def _discard(self, part: str):
+        if os.path.exists(part):
+            os.remove(part)
+        self._discard_state(part)
+
+
+_default: Optional[DownloadManager] = None
+
+
+def default_manager() -> DownloadManager:
+    global _default
+    if _default is None:
+        _default = DownloadManager()
+    return _default
@@ -1,11 +1,10 @@
 import datetime
-import hashlib
-import os
 from enum import Enum
-from typing import List, Optional, Iterable
+from typing import Dict, List, Optional, Iterable, Tuple
 
-import aiohttp
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, validator
+
+from .download import DownloadManager, default_manager
 
 
 class Permission(str, Enum):
@@ -34,6 +33,46 @@ class Group(BaseModel):
         return f'https://p.qlogo.cn/gh/{self.id}/{self.id}/'
 
 
+class GroupInterner:
+    """
+    解码时按(id, name, permission)共享Group实例，同一群的成员列表和消息sender只持有一份；
+    改名、bot权限变化时按群id失效。共享的实例不应该被原地修改
+    """
+
+    def __init__(self, max_size: int = 65536, enabled: bool = True):
+        self.max_size = max_size
+        self.enabled = enabled
+        self._groups: Dict[Tuple[int, str, Permission], Group] = {}
+        self._by_id: Dict[int, List[Tuple[int, str, Permission]]] = {}
+
+    def __len__(self):
+        return len(self._groups)
+
+    def intern(self, group: Group) -> Group:
+        if not self.enabled:
+            return group
+        key = (group.id, group.name, group.permission)
+        cached = self._groups.get(key)
+        if cached is not None:
+            return cached
+        if len(self._groups) >= self.max_size:
+            self.clear()
+        self._groups[key] = group
+        self._by_id.setdefault(group.id, []).append(key)
+        return group
+
+    def invalidate(self, group_id: int):
+        for key in self._by_id.pop(group_id, ()):
+            self._groups.pop(key, None)
+
+    def clear(self):
+        self._groups.clear()
+        self._by_id.clear()
+
+
+interned_groups = GroupInterner()
+
+
 class Member(BaseModel):
     id: int
     memberName: str
@@ -44,6 +83,11 @@ class Member(BaseModel):
     permission: Permission
     group: Group
 
+    @validator("group")
+    def intern_group(cls, group: Group) -> Group:
+        # 在字段校验(包括copy_on_model_validation的复制)之后替换为共享实例
+        return interned_groups.intern(group)
+
     def __int__(self):
         return self.id
 
@@ -114,27 +158,23 @@ class File(BaseModel):
     isDirectory: bool
     downloadInfo: Optional[DownloadInfo]
 
-    async def download_file(self, save_path: str, verify_file=False):
+    async def download_file(
+            self,
+            save_path: str,
+            verify_file=False,
+            manager: Optional[DownloadManager] = None
+    ) -> str:
+        """
+        :param verify_file: 校验sha1，不一致时抛出FileMismatchError
+        :param manager: 默认使用全局共享的DownloadManager
+        """
         if not self.downloadInfo:
             raise AttributeError("downloadInfo not found")
-        if verify_file:
-            vf = hashlib.sha1()
-        else:
-            vf = None
-        try:
-            with open(save_path, "wb") as fd:
-                async with aiohttp.request("GET", self.downloadInfo.url) as resp:
-                    async for bl in resp.content:
-                        if vf:
-                            vf.update(bl)
-                        fd.write(bl)
-        except:
-            os.remove(save_path)
-            raise
-        if verify_file:
-            if vf.hexdigest() != self.downloadInfo.sha1.lower():
-                os.remove(save_path)
-                raise NotImplementedError(vf.hexdigest(), self.downloadInfo.sha1.lower(), "not match")
+        return await (manager or default_manager()).download(
+            self.downloadInfo.url,
+            save_path,
+            self.downloadInfo.sha1 if verify_file else None
+        )
 
 
 class FileList(BaseModel):
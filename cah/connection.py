@@ -0,0 +1,105 @@
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Deque, Optional, Tuple
+
+from aiohttp import web
+
+from .filter import Predicate, accept_all
+from .metrics import RouteStats, utf8_len
+
+
+class OverflowPolicy(str, Enum):
+    DropOldest = "drop-oldest"
+    DropNewest = "drop-newest"
+    Disconnect = "disconnect"
+
+
+class Connection:
+    """
+    单个WebSocket的发送队列，由独立的writer task负责写出，
+    慢客户端只会堆积自己的队列而不会阻塞其他连接
+    """
+
+    def __init__(
+            self,
+            ws: web.WebSocketResponse,
+            max_size: int = 1024,
+            policy: OverflowPolicy = OverflowPolicy.DropOldest,
+            accepts: Predicate = accept_all,
+            stats: Optional[RouteStats] = None
+    ):
+        self.ws = ws
+        self.accepts = accepts
+        self.stats = stats or RouteStats()
+        self.max_size = max_size
+        self.policy = OverflowPolicy(policy)
+        self.dropped = 0
+        self.sent = 0
+        # (帧, UTF-8字节数)
+        self._queue: Deque[Tuple[str, int]] = deque()
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed or self.ws.closed
+
+    def start(self):
+        if not self._writer:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, frame: str, droppable: bool = True, size: Optional[int] = None) -> bool:
+        """
+        :param size: frame的UTF-8字节数，广播时由调用方对每帧算一次，省略时在这里计算
+        """
+        if self.closed:
+            return False
+        if droppable and len(self._queue) >= self.max_size:
+            if self.policy is OverflowPolicy.DropNewest:
+                self.dropped += 1
+                return False
+            elif self.policy is OverflowPolicy.DropOldest:
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                self.dropped += len(self._queue) + 1
+                self._queue.clear()
+                # 先标记关闭，之后的send直接拒绝
+                self._closed = True
+                self._closing = asyncio.create_task(self.close())
+                return False
+        self._queue.append((frame, utf8_len(frame) if size is None else size))
+        self._wakeup.set()
+        return True
+
+    async def _write_loop(self):
+        queue, ws, stats = self._queue, self.ws, self.stats
+        while not self._closed:
+            if not queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            frame, size = queue.popleft()
+            try:
+                await ws.send_str(frame)
+            except (ConnectionError, RuntimeError):
+                break
+            self.sent += 1
+            stats.frames_out += 1
+            stats.bytes_out += size
+        self._closed = True
+
+    async def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if not self.ws.closed:
+            await self.ws.close()
+        if self._writer and self._writer is not asyncio.current_task():
+            await self._writer
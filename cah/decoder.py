@@ -1,13 +1,33 @@
-from .method import SendMessage, Response
+from typing import TYPE_CHECKING
 
+from .message.chain import CacheMessage
+from .method import SendMessage, GetInfoFromId, StatusCode
+from .router import Router, error
 
-async def send_group_message(content: dict) -> dict:
+if TYPE_CHECKING:
+    from .server import MainServer
+
+router = Router()
+
+
+@router.route("sendGroupMessage", SendMessage)
+async def send_group_message(server: "MainServer", qq: int, req: SendMessage) -> dict:
+    cache = server.get_cache(qq)
+    if req.quote is not None and req.quote not in cache:
+        return error(StatusCode.TargetNotExist, "quote target not exist")
     return {
         "code": 0,
-        "messageId": -1
+        "messageId": cache.put(CacheMessage(type="GroupMessage", messageChain=req.messageChain))
     }
 
 
-handlers = {
-    "sendGroupMessage": send_group_message
-}
\ No newline at end of file
+@router.route("messageFromId", GetInfoFromId)
+async def message_from_id(server: "MainServer", qq: int, req: GetInfoFromId) -> dict:
+    message = server.get_cache(qq).get(req.id)
+    if not message:
+        return error(StatusCode.TargetNotExist, "message not exist")
+    return {
+        "code": 0,
+        "msg": "",
+        "data": message.dict()
+    }
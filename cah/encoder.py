@@ -0,0 +1,94 @@
+import json
+from typing import Any, Callable, Dict, Optional, Type, Union
+
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+from pydantic.utils import ROOT_KEY
+
+from .message.stream import Base64Source
+
+
+def default(obj: Any) -> Any:
+    """
+    在pydantic_encoder的基础上展开__root__模型(MessageChain等)，Base64Source在这里一次性编码
+    """
+    if isinstance(obj, BaseModel):
+        data = obj.dict()
+        return data[ROOT_KEY] if ROOT_KEY in data else data
+    elif isinstance(obj, Base64Source):
+        return obj.encode()
+    return pydantic_encoder(obj)
+
+
+class JsonCodec:
+    name = "json"
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = default) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+    def dump_model(self, model: BaseModel) -> str:
+        return self.dumps(model.dict())
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._dumps: Callable[..., bytes] = orjson.dumps
+        self.loads = orjson.loads
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = default) -> str:
+        return self._dumps(obj, default=default).decode()
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self._dumps: Callable[..., str] = ujson.dumps
+        self.loads = ujson.loads
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = default) -> str:
+        return self._dumps(obj, ensure_ascii=False, default=default)
+
+
+codecs: Dict[str, Type[JsonCodec]] = {
+    "orjson": OrjsonCodec,
+    "ujson": UjsonCodec,
+    "json": JsonCodec
+}
+
+
+def get_codec(codec: Union[str, JsonCodec, None] = None) -> JsonCodec:
+    """
+    None或"auto"时按orjson -> ujson -> json的顺序选择可用的实现
+    """
+    if isinstance(codec, JsonCodec):
+        return codec
+    elif codec in (None, "auto"):
+        for impl in codecs.values():
+            try:
+                return impl()
+            except ImportError:
+                continue
+    elif codec in codecs:
+        return codecs[codec]()
+    raise ValueError(f"unknown codec: {codec}")
+
+
+default_codec: Optional[JsonCodec] = None
+
+
+def set_default_codec(codec: Union[str, JsonCodec, None]) -> JsonCodec:
+    global default_codec
+    default_codec = get_codec(codec)
+    return default_codec
+
+
+def dump_model(model: BaseModel) -> str:
+    return (default_codec or set_default_codec(None)).dump_model(model)
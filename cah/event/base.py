@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 
-from ela.component.friend import Friend
+from cah.component.friend import Friend
 
 
 class BotEvent(BaseModel):
@@ -1,10 +1,10 @@
 import datetime
 from typing import Optional, Dict, List, Any
 
-from pydantic import Field, BaseModel
+from pydantic import Field, BaseModel, validator
 
 from cah.component.friend import Friend
-from cah.component.group import Permission, Group, Member, GroupHonorAction
+from cah.component.group import Permission, Group, Member, GroupHonorAction, interned_groups
 from cah.event.base import BotEvent, GroupEvent, FriendEvent
 
 
@@ -53,6 +53,11 @@ class BotGroupPermissionChangeEvent(GroupEvent):
     current: Permission
     group: Group
 
+    @validator("group")
+    def invalidate_group(cls, group: Group) -> Group:
+        interned_groups.invalidate(group.id)
+        return group
+
 
 class BotMuteEvent(GroupEvent):
     type = "BotMuteEvent"
@@ -98,6 +103,11 @@ class GroupNameChangeEvent(GroupEvent):
     group: Group
     operator: Member
 
+    @validator("group")
+    def invalidate_group(cls, group: Group) -> Group:
+        interned_groups.invalidate(group.id)
+        return group
+
 
 class GroupEntranceAnnouncementChangeEvent(GroupEvent):
     type = "GroupEntranceAnnouncementChangeEvent"
@@ -0,0 +1,92 @@
+from typing import Callable, FrozenSet, Iterable, Optional
+
+from pydantic import BaseModel
+
+from .event import events
+from .message.type import MessageType
+
+Predicate = Callable[[dict], bool]
+
+MESSAGE_TYPES: FrozenSet[str] = frozenset(MessageType.__members__)
+EVENT_TYPES: FrozenSet[str] = frozenset(
+    model.__fields__["type"].default
+    for model in vars(events).values()
+    if isinstance(model, type) and issubclass(model, BaseModel)
+    and "type" in model.__fields__ and model.__fields__["type"].default
+)
+
+
+def _group_id(data: dict) -> Optional[int]:
+    if "group" in data:
+        return data["group"]["id"]
+    for key in ("sender", "member", "operator"):
+        member = data.get(key)
+        if member and "group" in member:
+            return member["group"]["id"]
+
+
+def _friend_id(data: dict) -> Optional[int]:
+    if "friend" in data:
+        return data["friend"]["id"]
+    sender = data.get("sender")
+    if sender and "group" not in sender:
+        return sender["id"]
+
+
+def accept_all(_: dict) -> bool:
+    return True
+
+
+def compile_filter(
+        types: Optional[Iterable[str]] = None,
+        groups: Optional[Iterable[int]] = None,
+        friends: Optional[Iterable[int]] = None
+) -> Predicate:
+    """
+    根据订阅条件生成推送帧的过滤函数，只对设置了的条件做检查；
+    与群/好友无关的事件不受groups/friends限制
+    """
+    types = frozenset(types) if types is not None else None
+    groups = frozenset(groups) if groups is not None else None
+    friends = frozenset(friends) if friends is not None else None
+
+    if groups is None and friends is None:
+        if types is None:
+            return accept_all
+
+        def predicate(frame: dict) -> bool:
+            return frame["data"].get("type") in types
+        return predicate
+
+    def predicate(frame: dict) -> bool:
+        data = frame["data"]
+        if types is not None and data.get("type") not in types:
+            return False
+        if groups is not None:
+            gid = _group_id(data)
+            if gid is not None:
+                return gid in groups
+        if friends is not None:
+            fid = _friend_id(data)
+            if fid is not None:
+                return fid in friends
+        return True
+    return predicate
+
+
+def filter_from_query(query, default_types: Optional[FrozenSet[str]] = None) -> Predicate:
+    """
+    从连接参数types、groups、friends(逗号分隔)生成过滤函数
+    """
+    types, groups, friends = query.get("types"), query.get("groups"), query.get("friends")
+    if types:
+        types = frozenset(types.split(","))
+        if default_types is not None:
+            types &= default_types
+    else:
+        types = default_types
+    return compile_filter(
+        types,
+        [int(i) for i in groups.split(",")] if groups else None,
+        [int(i) for i in friends.split(",")] if friends else None
+    )
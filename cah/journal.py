@@ -0,0 +1,251 @@
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from .encoder import JsonCodec, get_codec
+
+KIND_MESSAGE = 0
+KIND_EVENT = 1
+
+# id, time, kind, length, key
+HEADER = struct.Struct("<QdBIq")
+# 记录没有key时写入的值
+NO_KEY = -(1 << 63)
+
+
+class _Segment:
+    __slots__ = (
+        "path", "first_id", "last_id", "size", "created", "updated", "index_ids", "index_offsets", "mm", "fd"
+    )
+
+    def __init__(self, path: str, first_id: int):
+        self.path = path
+        self.first_id = first_id
+        self.last_id = first_id - 1
+        self.size = 0
+        # 第一条和最后一条记录的时间，分别用于按时间切分和过期
+        self.created = self.updated = time.time()
+        self.index_ids: List[int] = []
+        self.index_offsets: List[int] = []
+        self.mm: Optional[mmap.mmap] = None
+        self.fd: Optional[int] = None
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self.mm is not None:
+            return self.mm[offset:offset + length]
+        return os.pread(self.fd, length, offset)
+
+    def seal(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.mm is None and self.size:
+            with open(self.path, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class Journal:
+    """
+    仅追加的消息/事件日志，按大小或segment_age切分segment，每index_interval条记录一个稀疏索引，
+    已封存的segment通过mmap读取，重启后只需扫描记录头即可恢复索引。
+记录可以带一个key(消息的Source.id)，key -> 记录id的索引常驻内存，同样由记录头重建。
+    过期以segment为单位，按其中最新一条记录的时间判断；segment_age默认为max_age的1/7，
+    写入量不大时也能按时间滚动和过期
+    """
+
+    def __init__(
+            self,
+            path: str,
+            segment_size: int = 64 * 1024 * 1024,
+            max_age: Optional[float] = 7 * 24 * 3600,
+            max_bytes: Optional[int] = None,
+            segment_age: Optional[float] = None,
+            index_interval: int = 64,
+            codec: Union[str, JsonCodec, None] = None
+    ):
+        self.path = path
+        self.segment_size = segment_size
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.segment_age = segment_age if segment_age is not None or max_age is None else max_age / 7
+        self.index_interval = index_interval
+        self.codec = get_codec(codec)
+        self._segments: List[_Segment] = []
+        self._firsts: List[int] = []
+        self._keys: Dict[int, int] = {}
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    @property
+    def first_id(self) -> int:
+        return self._segments[0].first_id
+
+    @property
+    def last_id(self) -> int:
+        return self._segments[-1].last_id
+
+    @property
+    def next_id(self) -> int:
+        return self.last_id + 1
+
+    def _load(self):
+        names = sorted(n for n in os.listdir(self.path) if n.endswith(".seg"))
+        for name in names[:-1]:
+            seg = _Segment(os.path.join(self.path, name), int(name[:-4]))
+            self._scan(seg)
+            seg.seal()
+            self._segments.append(seg)
+            self._firsts.append(seg.first_id)
+        if names:
+            self._open_active(int(names[-1][:-4]), names[-1])
+        else:
+            self._open_active(1)
+        self.expire()
+
+    def _scan(self, seg: _Segment):
+        size = os.path.getsize(seg.path)
+        if not size:
+            return
+        with open(seg.path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            offset = count = 0
+            while offset + HEADER.size <= size:
+                rid, written, _, length, key = HEADER.unpack_from(mm, offset)
+                if offset + HEADER.size + length > size:
+                    break
+                if not count:
+                    seg.created = written
+                seg.updated = written
+                if not count % self.index_interval:
+                    seg.index_ids.append(rid)
+                    seg.index_offsets.append(offset)
+                if key != NO_KEY:
+                    self._keys[key] = rid
+                seg.last_id = rid
+                offset += HEADER.size + length
+                count += 1
+        if offset != size:
+            # 截断崩溃时写了一半的记录
+            os.truncate(seg.path, offset)
+        seg.size = offset
+
+    def _open_active(self, first_id: int, name: Optional[str] = None):
+        seg = _Segment(os.path.join(self.path, name or f"{first_id:020d}.seg"), first_id)
+        if name:
+            self._scan(seg)
+        seg.fd = os.open(seg.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segments.append(seg)
+        self._firsts.append(seg.first_id)
+
+    def append(self, kind: int, data: Union[dict, bytes], key: Optional[int] = None) -> int:
+        if not isinstance(data, bytes):
+            data = self.codec.dumps(data).encode()
+        seg = self._segments[-1]
+        now = time.time()
+        if seg.size and (seg.size + HEADER.size + len(data) > self.segment_size
+                         or self.segment_age is not None and now - seg.created > self.segment_age):
+            seg = self._roll()
+        if not seg.size:
+            seg.created = now
+        rid = seg.last_id + 1
+        if not (rid - seg.first_id) % self.index_interval:
+            seg.index_ids.append(rid)
+            seg.index_offsets.append(seg.size)
+        os.write(seg.fd, HEADER.pack(rid, now, kind, len(data), NO_KEY if key is None else key) + data)
+        seg.size += HEADER.size + len(data)
+        seg.last_id = rid
+        seg.updated = now
+        if key is not None:
+            self._keys[key] = rid
+        return rid
+
+    def _roll(self) -> _Segment:
+        last = self._segments[-1]
+        last.seal()
+        self._open_active(last.last_id + 1)
+        self.expire()
+        return self._segments[-1]
+
+    def expire(self):
+        segments = self._segments
+        now = time.time()
+        total = sum(seg.size for seg in segments)
+        first_id = segments[0].first_id
+        while len(segments) > 1:
+            seg = segments[0]
+            expired = self.max_age is not None and now - seg.updated > self.max_age
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            total -= seg.size
+            seg.close()
+            os.remove(seg.path)
+            segments.pop(0)
+            self._firsts.pop(0)
+        if segments[0].first_id != first_id:
+            first_id = segments[0].first_id
+            self._keys = {key: rid for key, rid in self._keys.items() if rid >= first_id}
+
+    def _locate(self, rid: int) -> Optional[Tuple[_Segment, int]]:
+        pos = bisect_right(self._firsts, rid) - 1
+        if pos < 0:
+            return None
+        seg = self._segments[pos]
+        if rid > seg.last_id:
+            return None
+        i = bisect_right(seg.index_ids, rid) - 1
+        return seg, seg.index_offsets[i]
+
+    def _records(self, seg: _Segment, offset: int) -> Iterator[Tuple[int, int, int, int]]:
+        while offset < seg.size:
+            rid, _, kind, length, _ = HEADER.unpack(seg.read(offset, HEADER.size))
+            yield rid, kind, offset + HEADER.size, length
+            offset += HEADER.size + length
+
+    def get(self, rid: int) -> Optional[Tuple[int, bytes]]:
+        located = self._locate(rid)
+        if located:
+            seg, offset = located
+            for current, kind, start, length in self._records(seg, offset):
+                if current == rid:
+                    return kind, seg.read(start, length)
+                elif current > rid:
+                    break
+
+    def find(self, key: int) -> Optional[Tuple[int, bytes]]:
+        """
+        按key查询最近一条带有该key的记录
+        """
+        rid = self._keys.get(key)
+        if rid is not None:
+            return self.get(rid)
+
+    def load(self, rid: int, kind: int = KIND_MESSAGE) -> Optional[dict]:
+        record = self.get(rid)
+        if record and record[0] == kind:
+            return self.codec.loads(record[1])
+
+    def history(self, start_id: int, kind: Optional[int] = None) -> Iterator[Tuple[int, int, bytes]]:
+        start_id = max(start_id, self.first_id)
+        pos = max(bisect_right(self._firsts, start_id) - 1, 0)
+        for seg in self._segments[pos:]:
+            if seg.last_id < start_id:
+                continue
+            located = self._locate(start_id) if seg.first_id <= start_id else None
+            offset = located[1] if located else 0
+            for rid, rkind, start, length in self._records(seg, offset):
+                if rid >= start_id and (kind is None or rkind == kind):
+                    yield rid, rkind, seg.read(start, length)
+
+    def close(self):
+        for seg in self._segments:
+            seg.close()
@@ -1,8 +1,10 @@
 from enum import Enum
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional, Union
 from pydantic import BaseModel, HttpUrl
 
+from .stream import Base64Source
+
 
 class MessageModelTypes(str, Enum):
     Source = "Source"
@@ -31,7 +33,14 @@ class MessageModel(BaseModel):
 class RemoteResource(BaseModel):
     url: Optional[HttpUrl]
     path: Optional[Path]
-    base64: Optional[str]
+    base64: Optional[Union[Base64Source, str]]
+
+    @classmethod
+    def from_base64_stream(cls, path: Optional[str] = None, io: Optional[BinaryIO] = None):
+        """
+        以base64发送本地文件，内容在编码帧时才分块读取
+        """
+        return cls(base64=Base64Source(path, io))
 
 
 class Client(BaseModel):
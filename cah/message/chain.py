@@ -1,40 +1,115 @@
 import time
-from typing import List, Union, Type, Optional, Any, Tuple, Generator, Iterable
+from typing import List, Union, Type, Optional, Any, Tuple, Generator, Iterable, Callable, Dict
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, PrivateAttr, validator
 
+from . import code
 from .base import MessageModel, RemoteResource, MessageModelTypes
+from .compact import CompactElement, compact_all
 from .models import message_model, Source
+from .resource import UnpreparedResource
 
 MODEL_ARGS = Type[Union[RemoteResource, MessageModel]]
 
 
 class MessageChain(BaseModel):
     __root__: List[Any]
+    # 元素类型 -> 位置的索引，首次查询时建立，__add__时失效
+    _index: Optional[Dict[type, List[int]]] = PrivateAttr(None)
+    _index_key: Optional[Tuple[int, int]] = PrivateAttr(None)
+    _lookup: Dict[Any, List[int]] = PrivateAttr(default_factory=dict)
+    # __str__的结果，同样按(id(__root__), len(__root__))判断是否有效
+    _str: Optional[Tuple[Tuple[int, int], str]] = PrivateAttr(None)
 
     @validator("__root__")
     def create(cls, obj):
+        """
+        严格模式，用于客户端传入的不可信数据
+        """
         ret = []
+        table = message_model
         for item in obj:
             if isinstance(item, dict):
-                ret.append(message_model[item["type"]].parse_obj(item))
+                model = table.get(item.get("type"))
+                if model is None:
+                    raise ValueError(f"unknown message type: {item.get('type')}")
+                ret.append(model.parse_obj(item))
             elif isinstance(item, MessageModel):
                 ret.append(item)
+            elif isinstance(item, CompactElement):
+                ret.append(item.to_model())
+            elif isinstance(item, UnpreparedResource):
+                raise ValueError(f"{item!r} must be uploaded first, see ResourceUploader.prepare")
             else:
                 raise ValueError(item)
         return ret
 
+    @classmethod
+    def trusted(cls, obj: Iterable[Union[dict, MessageModel]]) -> "MessageChain":
+        """
+        信任模式，跳过校验直接构造元素，只用于自己产生过的数据(缓存、journal、已校验链中的嵌套链)
+        """
+        table = trusted_model
+        return cls.construct(__root__=[
+            table[item["type"]](item) if isinstance(item, dict)
+            else item.to_model() if isinstance(item, CompactElement)
+            else item
+            for item in obj
+        ])
+
+    def compact(self) -> tuple:
+        """
+        转为紧凑元素的tuple，可以再通过MessageChain.trusted还原
+        """
+        return compact_all(self.__root__)
+
+    def _positions(self, model_type: Union[Tuple[MODEL_ARGS], MODEL_ARGS]) -> List[int]:
+        root = self.__root__
+        if self._index_key != (id(root), len(root)):
+            index: Dict[type, List[int]] = {}
+            for pos, item in enumerate(root):
+                cls = type(item)
+                if cls in index:
+                    index[cls].append(pos)
+                else:
+                    index[cls] = [pos]
+            self._index, self._index_key = index, (id(root), len(root))
+            self._lookup = {}
+        lookup = self._lookup
+        positions = lookup.get(model_type)
+        if positions is None:
+            matched = [p for cls, p in self._index.items() if issubclass(cls, model_type)]
+            if len(matched) == 1:
+                positions = matched[0]
+            else:
+                positions = sorted(p for group in matched for p in group)
+            lookup[model_type] = positions
+        return positions
+
+    def _skip_source(self) -> int:
+        root = self.__root__
+        return 1 if root and isinstance(root[0], Source) else 0
+
+    @classmethod
+    def from_mirai_code(cls, text: str) -> "MessageChain":
+        return cls.construct(__root__=code.parse(text))
+
+    def as_mirai_code(self) -> str:
+        return code.serialize(self)
+
     def get_first_model(self, model_type: Union[Tuple[MODEL_ARGS], MODEL_ARGS]) \
             -> Union[MessageModel, RemoteResource, None]:
-        for item in self:
-            if isinstance(item, model_type):
-                return item
+        skip = self._skip_source()
+        for pos in self._positions(model_type):
+            if pos >= skip:
+                return self.__root__[pos]
 
     def get_all_model(self, model_type: Union[Tuple[MODEL_ARGS], MODEL_ARGS]) \
             -> Generator[Union[RemoteResource, MessageModel], None, None]:
-        for item in self:
-            if isinstance(item, model_type):
-                yield item
+        skip, root = self._skip_source(), self.__root__
+        for pos in self._positions(model_type):
+            if pos >= skip:
+                yield root[pos]
 
     def get_source(self) -> Optional[Source]:
         if Source in self:
@@ -48,13 +123,15 @@ class MessageChain(BaseModel):
             self.__root__.append(value)
         elif isinstance(value, MessageChain):
             self.__root__ += value.__root__
+        self._index_key = None
         return self
 
     def __iter__(self):
-        if Source in self:
-            yield from self.__root__[1:]
+        root = self.__root__
+        if root and isinstance(root[0], Source):
+            yield from root[1:]
         else:
-            yield from self.__root__
+            yield from root
 
     def __getitem__(self, index):
         return self.__root__[index]
@@ -63,13 +140,15 @@ class MessageChain(BaseModel):
         return len(self.__root__)
 
     def __str__(self):
-        return "".join([str(item) for item in self])
+        root = self.__root__
+        key = (id(root), len(root))
+        cached = self._str
+        if cached is None or cached[0] != key:
+            cached = self._str = (key, "".join([str(item) for item in self]))
+        return cached[1]
 
     def __contains__(self, item):
-        for e in self.__root__:
-            if isinstance(e, item):
-                return True
-        return False
+        return bool(self._positions(item))
 
     __repr__ = __str__
 
@@ -78,6 +157,10 @@ class CacheMessage(BaseModel):
     type: str
     messageChain: MessageChain
 
+    @classmethod
+    def trusted(cls, data: dict) -> "CacheMessage":
+        return cls.construct(type=data["type"], messageChain=MessageChain.trusted(data["messageChain"]))
+
 
 class Quote(MessageModel):
     type = MessageModelTypes.Quote
@@ -98,8 +181,103 @@ class MessageNode(BaseModel):
     messageChain: Optional[MessageChain]
     messageId: Optional[int]
 
+    @classmethod
+    def trusted(cls, data: dict) -> "MessageNode":
+        chain = data.get("messageChain")
+        return cls.construct(**dict(data, messageChain=chain and MessageChain.trusted(chain)))
+
     def __repr__(self):
         return f'[Node::sender="{self.senderName}({self.senderId})",time="{self.time}"]'
 
 
 message_model["Quote"] = Quote
+
+
+def _trusted_factory(model: Type[MessageModel]) -> Callable[[dict], MessageModel]:
+    fields = frozenset(model.__fields__) - {"type"}
+    construct = model.construct
+
+    def build(item: dict) -> MessageModel:
+        return construct(**{k: v for k, v in item.items() if k in fields})
+    return build
+
+
+def _trusted_quote(item: dict) -> Quote:
+    return Quote.construct(**{
+        k: MessageChain.trusted(v) if k == "origin" else v
+        for k, v in item.items() if k != "type"
+    })
+
+
+def _trusted_json(item: dict) -> MessageModel:
+    return message_model["Json"].construct(Json=item["json"])
+
+
+def _trusted_app(item: dict) -> MessageModel:
+    # 严格模式经由Json_t把content解析为dict；自己编码过的数据中content已经是dict
+    model = message_model["App"]
+    content = item["content"]
+    return model.construct(content=model.__config__.json_loads(content) if isinstance(content, str) else content)
+
+
+trusted_model: Dict[str, Callable[[dict], MessageModel]] = {
+    name: _trusted_factory(model) for name, model in message_model.items()
+}
+trusted_model["Quote"] = _trusted_quote
+trusted_model["Json"] = _trusted_json
+trusted_model["App"] = _trusted_app
+
+
+class LazyMessageChain(MessageChain):
+    """
+    保留原始的元素列表(以及可选的编码结果)，访问元素时才解码；
+    未经__add__修改时dict()直接返回原始列表，encoded()直接返回原始编码
+    """
+
+    _raw: Optional[list] = PrivateAttr(None)
+    _encoded: Optional[Union[str, bytes]] = PrivateAttr(None)
+    _modified: bool = PrivateAttr(False)
+
+    @classmethod
+    def from_raw(cls, items: list, encoded: Optional[Union[str, bytes]] = None) -> "LazyMessageChain":
+        chain = cls.construct()
+        chain._raw = items
+        chain._encoded = encoded
+        return chain
+
+    @classmethod
+    def from_encoded(cls, encoded: Union[str, bytes], loads: Callable[[Union[str, bytes]], list]) \
+            -> "LazyMessageChain":
+        return cls.from_raw(loads(encoded), encoded)
+
+    @property
+    def decoded(self) -> bool:
+        return "__root__" in self.__dict__
+
+    def __getattr__(self, name):
+        if name == "__root__":
+            root = self.__dict__["__root__"] = MessageChain.trusted(self._raw).__root__
+            return root
+        raise AttributeError(name)
+
+    def dict(self, **kwargs) -> dict:
+        if not self._modified:
+            return {"__root__": self._raw}
+        return super().dict(**kwargs)
+
+    def encoded(self, dumps: Callable[[list], Union[str, bytes]]) -> Union[str, bytes]:
+        if self._modified:
+            return dumps(self.dict()["__root__"])
+        if self._encoded is None:
+            self._encoded = dumps(self._raw)
+        return self._encoded
+
+    def __add__(self, value):
+        self._modified = True
+        self._encoded = None
+        return super().__add__(value)
+
+    def __len__(self):
+        if self.decoded:
+            return len(self.__root__)
+        return len(self._raw)
@@ -0,0 +1,125 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from .base import MessageModel
+from .models import Plain, At, AtAll, Face, Image, FlashImage, Voice, Xml, Json, App, Poke, Dice
+
+ESCAPE = {"\\": "\\\\", "[": "\\[", "]": "\\]", ":": "\\:", ",": "\\,", "\n": "\\n", "\r": "\\r"}
+UNESCAPE = {"n": "\n", "r": "\r"}
+PREFIX = "[mirai:"
+
+
+def escape(text: str) -> str:
+    if not any(c in text for c in ESCAPE):
+        return text
+    return "".join(ESCAPE.get(c, c) for c in text)
+
+
+decoders: Dict[str, Callable[[List[str]], MessageModel]] = {
+    "at": lambda args: At(target=int(args[0])),
+    "atall": lambda args: AtAll(),
+    "face": lambda args: Face(faceId=int(args[0]), name=args[1] if len(args) > 1 else ""),
+    "image": lambda args: Image(imageId=args[0]),
+    "flash": lambda args: FlashImage(imageId=args[0]),
+    "voice": lambda args: Voice(voiceId=args[0]),
+    "xml": lambda args: Xml(xml=",".join(args)),
+    "json": lambda args: Json(json=",".join(args)),
+    "app": lambda args: App(content=",".join(args)),
+    "poke": lambda args: Poke(name=args[0]),
+    "dice": lambda args: Dice(value=int(args[0]))
+}
+
+encoders: Dict[type, Callable[[MessageModel], Tuple[str, Iterable[str]]]] = {
+    At: lambda e: ("at", (str(e.target),)),
+    AtAll: lambda e: ("atall", ()),
+    Face: lambda e: ("face", (str(e.faceId), e.name) if e.name else (str(e.faceId),)),
+    Image: lambda e: ("image", (e.imageId,)),
+    FlashImage: lambda e: ("flash", (e.imageId,)),
+    Voice: lambda e: ("voice", (e.voiceId,)),
+    Xml: lambda e: ("xml", (e.xml,)),
+    Json: lambda e: ("json", (e.Json,)),
+    App: lambda e: ("app", (App.__config__.json_dumps(e.content),)),
+    Poke: lambda e: ("poke", tuple(str(i) for i in Poke.InternalType[e.name].value)
+                     if e.name in Poke.InternalType.__members__ else (e.name,)),
+    Dice: lambda e: ("dice", (str(e.value),))
+}
+
+
+def serialize(elements: Iterable[MessageModel]) -> str:
+    """
+    转为可逆的mirai码，文本和参数中的特殊字符会被转义；无法表示的元素使用其str形式
+    """
+    out = []
+    for element in elements:
+        if isinstance(element, Plain):
+            out.append(escape(element.text))
+            continue
+        encoder = encoders.get(type(element))
+        kind, args = encoder(element) if encoder else (None, ())
+        # 只有url/path/base64而没有imageId/voiceId的资源同样无法表示
+        if kind is None or None in args:
+            out.append(escape(str(element)))
+        else:
+            out.append(f"{PREFIX}{kind}" + "".join(":" + escape(arg) if i == 0 else "," + escape(arg)
+                                                  for i, arg in enumerate(args)) + "]")
+    return "".join(out)
+
+
+def parse(code: str) -> List[MessageModel]:
+    """
+    单遍扫描mirai码，未知或格式错误的码按普通文本处理
+    """
+    result: List[MessageModel] = []
+    text: List[str] = []
+    i, n = 0, len(code)
+    while i < n:
+        c = code[i]
+        if c == "\\" and i + 1 < n:
+            text.append(UNESCAPE.get(code[i + 1], code[i + 1]))
+            i += 2
+        elif c == "[" and code.startswith(PREFIX, i):
+            element, end = _parse_code(code, i + len(PREFIX))
+            if element is None:
+                text.append(c)
+                i += 1
+                continue
+            if text:
+                result.append(Plain(text="".join(text)))
+                text = []
+            result.append(element)
+            i = end
+        else:
+            text.append(c)
+            i += 1
+    if text:
+        result.append(Plain(text="".join(text)))
+    return result
+
+
+def _parse_code(code: str, i: int):
+    args: List[str] = []
+    buf: List[str] = []
+    n = len(code)
+    while i < n:
+        c = code[i]
+        if c == "\\" and i + 1 < n:
+            buf.append(UNESCAPE.get(code[i + 1], code[i + 1]))
+            i += 2
+            continue
+        elif c == "]":
+            args.append("".join(buf))
+            decoder = decoders.get(args[0])
+            if decoder is None:
+                return None, i
+            try:
+                return decoder(args[1:]), i + 1
+            except (ValueError, IndexError, AttributeError, OverflowError):
+                return None, i
+        elif c == "[":
+            return None, i
+        elif (c == ":" and not args) or (c == "," and args):
+            args.append("".join(buf))
+            buf = []
+        else:
+            buf.append(c)
+        i += 1
+    return None, i
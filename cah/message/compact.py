@@ -0,0 +1,147 @@
+from typing import Dict, Iterable, Tuple, Type, Union
+
+from .base import MessageModel
+from .models import Source, Plain, At, AtAll, Face, Image, FlashImage, Voice, Dice
+
+
+class CompactElement:
+    """
+    消息元素的紧凑表示：__slots__、不可变、无__dict__，
+    用于在缓存和队列中大量持有元素；与pydantic模型之间可以互相转换
+    """
+
+    __slots__ = ()
+    type: str
+    model: Type[MessageModel]
+
+    def __init__(self, *args, **kwargs):
+        names = self.__slots__
+        for name, value in zip(names, args):
+            object.__setattr__(self, name, value)
+        for name in names[len(args):]:
+            object.__setattr__(self, name, kwargs.get(name))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, item):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def _values(self) -> Tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other._values() == self._values()
+
+    def __hash__(self):
+        return hash((self.type, self._values()))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(" + ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self.__slots__
+        ) + ")"
+
+    def __str__(self):
+        return self.model.__str__(self)
+
+    def __reduce__(self):
+        return type(self), self._values()
+
+    def dict(self) -> dict:
+        data = {"type": self.type}
+        for name in self.__slots__:
+            data[name] = getattr(self, name)
+        return data
+
+    def to_model(self) -> MessageModel:
+        return self.model.construct(**{name: getattr(self, name) for name in self.__slots__})
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CompactElement":
+        return cls(*(data.get(name) for name in cls.__slots__))
+
+    @classmethod
+    def from_model(cls, model: MessageModel) -> "CompactElement":
+        return cls(*(getattr(model, name) for name in cls.__slots__))
+
+
+class CompactSource(CompactElement):
+    __slots__ = ("id", "time")
+    type = "Source"
+    model = Source
+
+
+class CompactPlain(CompactElement):
+    __slots__ = ("text",)
+    type = "Plain"
+    model = Plain
+
+
+class CompactAt(CompactElement):
+    __slots__ = ("target",)
+    type = "At"
+    model = At
+
+
+class CompactAtAll(CompactElement):
+    __slots__ = ()
+    type = "AtAll"
+    model = AtAll
+
+    def __str__(self):
+        return "[mirai:atall]"
+
+
+class CompactFace(CompactElement):
+    __slots__ = ("faceId", "name")
+    type = "Face"
+    model = Face
+
+
+class CompactImage(CompactElement):
+    __slots__ = ("imageId", "url", "path", "base64")
+    type = "Image"
+    model = Image
+
+
+class CompactFlashImage(CompactElement):
+    __slots__ = ("imageId", "url", "path", "base64")
+    type = "FlashImage"
+    model = FlashImage
+
+
+class CompactVoice(CompactElement):
+    __slots__ = ("voiceId", "url", "path", "base64", "length")
+    type = "Voice"
+    model = Voice
+
+
+class CompactDice(CompactElement):
+    __slots__ = ("value",)
+    type = "Dice"
+    model = Dice
+
+
+compact_model: Dict[str, Type[CompactElement]] = {
+    cls.type: cls for cls in (
+        CompactSource, CompactPlain, CompactAt, CompactAtAll, CompactFace,
+        CompactImage, CompactFlashImage, CompactVoice, CompactDice
+    )
+}
+
+
+def compact(element: Union[dict, MessageModel, CompactElement]) -> Union[CompactElement, MessageModel, dict]:
+    """
+    转为紧凑表示，没有紧凑形式的元素原样返回
+    """
+    if isinstance(element, CompactElement):
+        return element
+    elif isinstance(element, dict):
+        cls = compact_model.get(element.get("type"))
+        return cls.from_dict(element) if cls else element
+    cls = compact_model.get(getattr(element.type, "value", element.type))
+    return cls.from_model(element) if cls else element
+
+
+def compact_all(elements: Iterable[Union[dict, MessageModel]]) -> tuple:
+    return tuple(compact(element) for element in elements)
@@ -7,6 +7,7 @@ from typing import Optional, Union, Literal, BinaryIO
 from pydantic import Json as Json_t
 
 from .base import MessageModel, RemoteResource, MessageModelTypes
+from .resource import UnpreparedResource
 from ..component.group import Member
 
 
@@ -94,7 +95,7 @@ class Image(MessageModel, RemoteResource):
     def from_path(cls, path: str):
         if not os.path.isfile(path):
             raise FileNotFoundError(path)
-        return UnpreparedResource(cls, "uploadImage", io=open(path, "rb"))
+        return UnpreparedResource(cls, "uploadImage", path=path)
 
     @classmethod
     def from_io(cls, obj: BinaryIO):
@@ -138,7 +139,7 @@ class Voice(MessageModel, RemoteResource):
     def from_path(cls, path: str):
         if not os.path.isfile(path):
             raise FileNotFoundError(path)
-        return UnpreparedResource(cls, "uploadVoice", io=open(path, "rb"))
+        return UnpreparedResource(cls, "uploadVoice", path=path)
 
     @classmethod
     def from_io(cls, obj: BinaryIO):
@@ -176,7 +177,7 @@ class Json(MessageModel):
 
     def dict(self, *_, **kwargs) -> dict:
         data = dict(
-            *self._iter(
+            self._iter(
                 to_dict=True,
                 **kwargs
             )
@@ -244,7 +245,9 @@ class Poke(MessageModel):
 
     def __str__(self):
         # mapper: https://github.com/mamoe/mirai/blob/dev/mirai-core-api/src/commonMain/kotlin/message/data/PokeMessage.kt#L60
-        return "[mirai:poke:{0},{1},{2}]".format(*getattr(self.InternalType, self.name).value)
+        if self.name not in self.InternalType.__members__:
+            return f"[mirai:poke:{self.name}]"
+        return "[mirai:poke:{0},{1},{2}]".format(*self.InternalType[self.name].value)
 
 
 class Dice(MessageModel):
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import (
+    TYPE_CHECKING, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
+)
+
+import aiohttp
+
+from .base import MessageModel
+from .stream import CHUNK_SIZE, read_chunks
+
+if TYPE_CHECKING:
+    from .chain import MessageChain
+
+# (command, 分块数据) -> imageId/voiceId
+Uploader = Callable[[str, AsyncIterator[bytes]], Awaitable[str]]
+
+
+class UploadError(Exception):
+    def __init__(self, command: str, code: Optional[int], msg: str):
+        super(UploadError, self).__init__(command, code, msg)
+        self.command = command
+        self.code = code
+        self.msg = msg
+
+
+class UnpreparedResource:
+    """
+    还没有上传的图片/语音。path形式的文件在上传时才打开并随即关闭；
+    io形式的对象由调用方负责关闭
+    """
+
+    __slots__ = ("model", "command", "path", "io", "chunk_size")
+
+    def __init__(
+            self,
+            model: Type[MessageModel],
+            command: str,
+            path: Optional[str] = None,
+            io: Optional[BinaryIO] = None,
+            chunk_size: int = CHUNK_SIZE
+    ):
+        if (path is None) == (io is None):
+            raise ValueError("exactly one of path and io is required")
+        self.model = model
+        self.command = command
+        self.path = path
+        self.io = io
+        self.chunk_size = chunk_size
+
+    def __repr__(self):
+        return f"<UnpreparedResource {self.model.__name__} {self.path or self.io!r}>"
+
+    @property
+    def seekable(self) -> bool:
+        return self.path is not None or self.io.seekable()
+
+    def prepared(self, resource_id: str) -> MessageModel:
+        return self.model(resource_id)
+
+    async def chunks(self, hasher=None, executor: Optional[Executor] = None) -> AsyncIterator[bytes]:
+        """
+        分块读出内容，传入hasher时顺便更新摘要；io对象读完后回到原来的位置
+        """
+        async for chunk in read_chunks(self.path, self.io, self.chunk_size, executor):
+            if hasher:
+                hasher.update(chunk)
+            yield chunk
+
+    async def digest(self, executor: Optional[Executor] = None) -> str:
+        hasher = hashlib.sha256()
+        async for _ in self.chunks(hasher, executor):
+            pass
+        return hasher.hexdigest()
+
+
+class ResourceUploader:
+    """
+    上传UnpreparedResource并按(command, sha256)缓存得到的id，超出max_entries时按LRU淘汰；
+    同一内容的并发上传合并为一次。
+    可以seek的资源先单独算一遍摘要，命中缓存就不再上传；不能seek的在上传的同时计算摘要
+    """
+
+    def __init__(
+            self,
+            upload: Uploader,
+            max_entries: int = 1024,
+            concurrency: int = 4,
+            executor: Optional[Executor] = None
+    ):
+        self._upload = upload
+        self.max_entries = max_entries
+        self._executor = executor
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _remember(self, key: Tuple[str, str], resource_id: str):
+        self._cache[key] = resource_id
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def upload(self, resource: UnpreparedResource) -> MessageModel:
+        if not resource.seekable:
+            hasher = hashlib.sha256()
+            self.misses += 1
+            async with self._semaphore:
+                resource_id = await self._upload(resource.command, resource.chunks(hasher, self._executor))
+            self._remember((resource.command, hasher.hexdigest()), resource_id)
+            return resource.prepared(resource_id)
+
+        key = (resource.command, await resource.digest(self._executor))
+        resource_id = self._cache.get(key)
+        if resource_id is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return resource.prepared(resource_id)
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            return resource.prepared(await asyncio.shield(pending))
+
+        self.misses += 1
+        future = self._pending[key] = asyncio.get_running_loop().create_future()
+        try:
+            async with self._semaphore:
+                resource_id = await self._upload(resource.command, resource.chunks(executor=self._executor))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免"exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(resource_id)
+            self._remember(key, resource_id)
+        finally:
+            self._pending.pop(key, None)
+        return resource.prepared(resource_id)
+
+    async def prepare(self, elements: Iterable[Union[MessageModel, UnpreparedResource]]) -> List[MessageModel]:
+        """
+        并发上传elements中所有未上传的资源，按原顺序返回元素
+        """
+        elements = list(elements)
+        positions = [i for i, item in enumerate(elements) if isinstance(item, UnpreparedResource)]
+        results = await asyncio.gather(*(self.upload(elements[i]) for i in positions))
+        for i, model in zip(positions, results):
+            elements[i] = model
+        return elements
+
+    async def prepare_chain(self, elements: Iterable[Union[MessageModel, UnpreparedResource]]) -> "MessageChain":
+        from .chain import MessageChain
+        return MessageChain.trusted(await self.prepare(elements))
+
+
+def http_uploader(
+        session: aiohttp.ClientSession,
+        base_url: str,
+        session_key: str,
+        target: str = "group"
+) -> Uploader:
+    """
+    mirai-api-http的multipart上传接口，文件部分以chunked方式流式发送
+    """
+    fields = {"uploadImage": ("img", "imageId"), "uploadVoice": ("voice", "voiceId")}
+
+    async def upload(command: str, chunks: AsyncIterator[bytes]) -> str:
+        field, key = fields[command]
+        with aiohttp.MultipartWriter("form-data") as writer:
+            for name, value in (("sessionKey", session_key), ("type", target)):
+                writer.append(value).set_content_disposition("form-data", name=name)
+            writer.append(chunks, {"Content-Type": "application/octet-stream"}).set_content_disposition(
+                "form-data", name=field, filename=field
+            )
+            async with session.post(f"{base_url.rstrip('/')}/{command}", data=writer) as resp:
+                data = await resp.json(content_type=None)
+        if not isinstance(data, dict) or key not in data:
+            data = data if isinstance(data, dict) else {}
+            raise UploadError(command, data.get("code"), data.get("msg", "unexpected response"))
+        return data[key]
+
+    return upload
@@ -0,0 +1,117 @@
+import asyncio
+import base64
+import os
+import re
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, BinaryIO, List, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def read_chunks(
+        path: Optional[str],
+        io: Optional[BinaryIO],
+        chunk_size: int = CHUNK_SIZE,
+        executor: Optional[Executor] = None
+) -> AsyncIterator[bytes]:
+    """
+    在executor中分块读取文件；path在读取时才打开并随即关闭，io读完后回到原来的位置
+    """
+    loop = asyncio.get_running_loop()
+    fd = open(path, "rb") if path is not None else io
+    start = fd.tell() if path is None and fd.seekable() else None
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, fd.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if path is not None:
+            fd.close()
+        elif start is not None:
+            fd.seek(start)
+
+
+class Base64Source:
+    """
+    RemoteResource.base64的流式来源：编码推迟到发送时，按块进行，不在模型中持有整段base64字符串
+    """
+
+    __slots__ = ("path", "io", "chunk_size")
+
+    def __init__(self, path: Optional[str] = None, io: Optional[BinaryIO] = None, chunk_size: int = CHUNK_SIZE):
+        if (path is None) == (io is None):
+            raise ValueError("exactly one of path and io is required")
+        self.path = path
+        self.io = io
+        # 按3字节对齐，各块单独编码后直接拼接不会出现中间的padding
+        self.chunk_size = max(3, chunk_size - chunk_size % 3)
+
+    def __repr__(self):
+        return f"<Base64Source {self.path or self.io!r}>"
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value):
+        if not isinstance(value, cls):
+            raise TypeError("Base64Source required")
+        return value
+
+    async def chunks(self, executor: Optional[Executor] = None) -> AsyncIterator[str]:
+        async for chunk in read_chunks(self.path, self.io, self.chunk_size, executor):
+            yield base64.b64encode(chunk).decode()
+
+    def encode(self) -> str:
+        """
+        一次性编码，用于没有走流式发送的场合
+        """
+        if self.path is not None:
+            with open(self.path, "rb") as fd:
+                return base64.b64encode(fd.read()).decode()
+        start = self.io.tell() if self.io.seekable() else None
+        try:
+            return base64.b64encode(self.io.read()).decode()
+        finally:
+            if start is not None:
+                self.io.seek(start)
+
+
+async def iter_frame(data: Any, codec=None, executor: Optional[Executor] = None) -> AsyncIterator[str]:
+    """
+    编码data，其中的Base64Source按块输出，其余部分照常由codec编码。
+    可以直接作为aiohttp的请求/响应体(encode后)，峰值内存约为一个块的大小
+    """
+    from .. import encoder
+    codec = encoder.get_codec(codec) if codec is not None else encoder.default_codec or encoder.set_default_codec(None)
+    sources: List[Base64Source] = []
+    token = f"cah-b64-{os.urandom(8).hex()}-"
+
+    def placeholder(obj: Any) -> Any:
+        if isinstance(obj, Base64Source):
+            sources.append(obj)
+            return f"{token}{len(sources) - 1}"
+        return encoder.default(obj)
+
+    parts = re.split(f"{token}(\\d+)", codec.dumps(data, placeholder))
+    yield parts[0]
+    for i in range(1, len(parts), 2):
+        async for chunk in sources[int(parts[i])].chunks(executor):
+            yield chunk
+        yield parts[i + 1]
+
+
+async def iter_body(data: Any, codec=None, executor: Optional[Executor] = None) -> AsyncIterator[bytes]:
+    async for part in iter_frame(data, codec, executor):
+        yield part.encode()
+
+
+async def dump_frame(data: Any, codec=None, executor: Optional[Executor] = None) -> str:
+    """
+    WebSocket的文本帧必须完整发送，这里只省去了模型中的base64副本和编码时的再次拷贝
+    """
+    return "".join([part async for part in iter_frame(data, codec, executor)])
+
@@ -3,10 +3,10 @@ from typing import Optional, Union
 
 from pydantic import BaseModel
 
-from ela.component.friend import Friend
-from ela.component.group import Member, Group
+from cah.component.friend import Friend
+from cah.component.group import Member, Group
 from .base import Client
-from .chain import MessageChain
+from .chain import MessageChain, LazyMessageChain
 from .models import Source
 
 
@@ -67,5 +67,10 @@ class MessageType(Enum):
         return item in cls.__members__
 
     @classmethod
-    def to_message(cls, name: str, data: dict) -> BaseMessageType:
+    def to_message(cls, name: str, data: dict, lazy: bool = False) -> BaseMessageType:
+        """
+        :param lazy: messageChain保持原始数据，只在访问元素时解码，适合原样转发
+        """
+        if lazy and data.get("messageChain") is not None:
+            data = dict(data, messageChain=LazyMessageChain.from_raw(data["messageChain"]))
         return getattr(cls, name).value[0](**data)
@@ -1,3 +1,4 @@
+from enum import IntEnum
 from typing import Optional
 
 from pydantic import BaseModel
@@ -88,3 +89,19 @@ class MuteMember(GetMemberProfile):
 
 class KickMember(GetMemberProfile):
     msg: Optional[str]
+
+
+class StatusCode(IntEnum):
+    Normal = 0
+    WrongVerifyKey = 1
+    BotNotExist = 2
+    InvalidSession = 3
+    SessionNotVerified = 4
+    TargetNotExist = 5
+    FileNotExist = 6
+    NoPermission = 10
+    BotMuted = 20
+    MessageTooLong = 30
+    BadRequest = 400
+    UnknownCommand = 404
+    InternalError = 500
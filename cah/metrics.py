@@ -0,0 +1,96 @@
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .monitor import LoopMonitor
+    from .session import SessionStore
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> Iterable[str]:
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+def utf8_len(text: str) -> int:
+    # 纯ASCII的str可以直接取长度(isascii只读标志位)，否则才需要编码
+    return len(text) if text.isascii() else len(text.encode())
+
+
+class RouteStats:
+    __slots__ = ("frames_in", "bytes_in", "frames_out", "bytes_out")
+
+    def __init__(self):
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+
+
+class Metrics:
+    """
+    计数器在构造时按命令和路由预先分配，热路径上只做属性自增；
+    会话数和队列深度这类gauge在抓取时才从SessionStore计算。
+    bytes按文本帧UTF-8编码后的字节数计
+    """
+
+    def __init__(self, commands: Iterable[str], routes: Iterable[str]):
+        self.commands: Dict[str, Histogram] = {command: Histogram() for command in commands}
+        self.routes: Dict[str, RouteStats] = {route: RouteStats() for route in routes}
+        self.handshake_failures = 0
+
+    def route(self, path: str) -> RouteStats:
+        stats = self.routes.get(path)
+        if stats is None:
+            stats = self.routes[path] = RouteStats()
+        return stats
+
+    def render(self, sessions: "SessionStore", monitor: Optional["LoopMonitor"] = None) -> str:
+        lines: List[str] = [
+            "# HELP cah_command_latency_seconds Command handling latency",
+            "# TYPE cah_command_latency_seconds histogram"
+        ]
+        for command, histogram in self.commands.items():
+            lines.extend(histogram.render("cah_command_latency_seconds", f'command="{command}"'))
+        for attr, kind in (("frames_in", "counter"), ("bytes_in", "counter"),
+                           ("frames_out", "counter"), ("bytes_out", "counter")):
+            name = f"cah_ws_{attr}_total"
+            lines.append(f"# TYPE {name} {kind}")
+            for route, stats in self.routes.items():
+                lines.append(f'{name}{{route="{route}"}} {getattr(stats, attr)}')
+        lines.append("# TYPE cah_handshake_failures_total counter")
+        lines.append(f"cah_handshake_failures_total {self.handshake_failures}")
+        gauges = (
+            # 其他worker签发、在本地解析出的session没有连接，不计入
+            ("cah_active_sessions", lambda bound: sum(1 for s in bound.values() if s.conn)),
+            ("cah_queue_depth", lambda bound: sum(s.conn.depth for s in bound.values() if s.conn)),
+            ("cah_queue_dropped", lambda bound: sum(s.conn.dropped for s in bound.values() if s.conn))
+        )
+        for name, measure in gauges:
+            lines.append(f"# TYPE {name} gauge")
+            for qq, bound in sessions.bots():
+                lines.append(f'{name}{{qq="{qq}"}} {measure(bound)}')
+        if monitor:
+            lines.extend(monitor.render())
+        lines.append("")
+        return "\n".join(lines)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import deque
+from itertools import count
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+from .metrics import Histogram
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class LoopMonitor:
+    """
+    定时采样事件循环延迟，并记录正在执行的命令/推送；
+    延迟或单个handler耗时超过阈值时记下当时的现场
+    """
+
+    def __init__(
+            self,
+            interval: float = 0.1,
+            lag_threshold: float = 0.1,
+            slow_threshold: float = 0.5,
+            history: int = 100
+    ):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.slow_threshold = slow_threshold
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.lag_histogram = Histogram(LAG_BUCKETS)
+        self.slow: Deque[dict] = deque(maxlen=history)
+        self.stalls: Deque[dict] = deque(maxlen=history)
+        self._active: Dict[int, Tuple[str, str, str, float]] = {}
+        self._last: Optional[Tuple[str, str, str, float]] = None
+        self._tokens = count()
+        self._task: Optional[asyncio.Task] = None
+
+    def begin(self, kind: str, name: str, sync_id: str) -> int:
+        token = next(self._tokens)
+        self._active[token] = (kind, name, sync_id, time.perf_counter())
+        return token
+
+    def end(self, token: int):
+        kind, name, sync_id, start = self._active.pop(token)
+        duration = time.perf_counter() - start
+        self._last = (kind, name, sync_id, duration)
+        if duration > self.slow_threshold:
+            self.slow.append({
+                "time": time.time(),
+                "kind": kind,
+                "name": name,
+                "syncId": sync_id,
+                "duration": duration
+            })
+
+    def _running(self, now: float) -> Iterable[dict]:
+        for kind, name, sync_id, start in self._active.values():
+            yield {"kind": kind, "name": name, "syncId": sync_id, "elapsed": now - start}
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = lag = max(loop.time() - start - self.interval, 0.0)
+            self.lag_histogram.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.lag_threshold:
+                # 阻塞型的handler在采样醒来前已经结束，所以一并记下最近完成的一个
+                last = self._last
+                self.stalls.append({
+                    "time": time.time(),
+                    "lag": lag,
+                    "running": list(self._running(time.perf_counter())),
+                    "last": last and dict(zip(("kind", "name", "syncId", "duration"), last))
+                })
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._sample())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "lag": self.lag,
+            "maxLag": self.max_lag,
+            "running": list(self._running(time.perf_counter())),
+            "slow": list(self.slow),
+            "stalls": list(self.stalls)
+        }
+
+    def render(self) -> Iterable[str]:
+        yield "# TYPE cah_loop_lag_seconds histogram"
+        yield from self.lag_histogram.render("cah_loop_lag_seconds", 'loop="main"')
+        yield "# TYPE cah_loop_lag_max_seconds gauge"
+        yield f"cah_loop_lag_max_seconds {self.max_lag}"
+        yield "# TYPE cah_slow_handlers_recorded gauge"
+        yield f"cah_slow_handlers_recorded {len(self.slow)}"
@@ -0,0 +1,99 @@
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Iterator, List, Optional
+
+
+class ReplayRing:
+    """
+    单个bot最近推送帧的环形缓冲，seq单调递增，
+    帧只在首次需要时编码并缓存在条目里。
+    非owner worker的ring(authoritative=False)只在订阅期间收到帧，seq可能不连续，
+    重放时对缺口补上ReplayGap；它也无法判断服务端是否重启过
+    """
+
+    def __init__(self, size: int = 1024, authoritative: bool = True):
+        self.seq = 0
+        self.authoritative = authoritative
+        self._entries: Deque[List] = deque(maxlen=size)
+
+    @property
+    def first_seq(self) -> int:
+        return self._entries[0][0] if self._entries else self.seq + 1
+
+    def push(self, data: dict) -> List:
+        self.seq += 1
+        entry = [self.seq, data, None]
+        self._entries.append(entry)
+        return entry
+
+    def record(self, data: dict) -> List:
+        """
+        记录由其他worker编号过的帧
+        """
+        self.seq = max(self.seq, data["seq"])
+        entry = [data["seq"], data, None]
+        self._entries.append(entry)
+        return entry
+
+    def has_gap(self, resume_from: int) -> bool:
+        return resume_from + 1 < self.first_seq or resume_from > self.seq
+
+    def since(self, resume_from: int) -> Iterator[List]:
+        entries = self._entries
+        if not entries or resume_from >= self.seq:
+            return iter(())
+        # 按seq二分查找，seq不一定连续
+        lo, hi = 0, len(entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if entries[mid][0] <= resume_from:
+                lo = mid + 1
+            else:
+                hi = mid
+        return islice(entries, lo, None)
+
+    @staticmethod
+    def gap_frame(start: int, end: Optional[int], reset: bool = False) -> dict:
+        """
+        [start, end]范围内的帧已经无法重放，end为None表示范围未知；
+        seq取缺口的末尾，后面紧跟的是更早的帧，客户端记录的seq不能越过它们
+        """
+        return {
+            "syncId": "-1",
+            "seq": end if end is not None else start - 1,
+            "data": {
+                "type": "ReplayGap",
+                "from": start,
+                "to": end,
+                "reset": reset
+            }
+        }
+
+    def replay(
+            self,
+            resume_from: int,
+            accepts: Callable[[dict], bool],
+            encode: Callable[[dict], str]
+    ) -> Iterator[str]:
+        if resume_from > self.seq:
+            if not self.authoritative:
+                # 本worker没见过更新的帧，不知道之后是否有遗漏
+                yield encode(self.gap_frame(resume_from + 1, None))
+                return
+            # resumeFrom超过当前seq说明服务端已重启，seq重新计数
+            yield encode(self.gap_frame(1, self.first_seq - 1, True))
+            resume_from = self.first_seq - 1
+        expected = resume_from + 1
+        for entry in self.since(resume_from):
+            if entry[0] > expected:
+                yield encode(self.gap_frame(expected, entry[0] - 1))
+            expected = entry[0] + 1
+            if accepts(entry[1]):
+                if entry[2] is None:
+                    entry[2] = encode(entry[1])
+                yield entry[2]
+
+
+def parse_resume(value: Optional[str]) -> Optional[int]:
+    if value is not None and value.lstrip("-").isdigit():
+        return int(value)
@@ -0,0 +1,249 @@
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Union
+
+from pydantic import BaseModel
+
+from .component.friend import Friend
+from .component.group import Group, Member, Permission, interned_groups
+
+Contact = Union[BaseModel, dict]
+
+
+class Roster:
+    """
+    单个bot的群、群成员和好友，加载一次快照后由事件增量维护，成员只跟踪load_members过的群；
+    同一群的成员共享roster中的Group实例，改名等只改一处。
+    seq不连续、掉线重连或事件引用了不存在的成员时，只把受影响的部分标记为stale，
+    由resync重新拉取
+    """
+
+    def __init__(self):
+        self.groups: Dict[int, Group] = {}
+        self.friends: Dict[int, Friend] = {}
+        self._members: Dict[int, Dict[int, Member]] = {}
+        self.seq: Optional[int] = None
+        self.stale_groups: Set[int] = set()
+        self.stale_group_list = False
+        self.stale_friends = False
+
+    @property
+    def stale(self) -> bool:
+        return bool(self.stale_groups or self.stale_group_list or self.stale_friends)
+
+    def member(self, group_id: int, member_id: int) -> Optional[Member]:
+        members = self._members.get(group_id)
+        return members.get(member_id) if members else None
+
+    def members(self, group_id: int) -> Optional[Dict[int, Member]]:
+        return self._members.get(group_id)
+
+    def load_groups(self, groups: Iterable[Contact]):
+        fresh = {}
+        for group in groups:
+            group = _own_group(group)
+            current = self.groups.get(group.id)
+            if current is not None:
+                current.name, current.permission = group.name, group.permission
+                group = current
+            fresh[group.id] = group
+        for group_id in self.groups.keys() - fresh.keys():
+            self._drop_group(group_id)
+        self.groups = fresh
+        self.stale_group_list = False
+
+    def load_members(self, group_id: int, members: Iterable[Contact]):
+        group = self.groups.get(group_id)
+        table = {}
+        for member in members:
+            member = member if isinstance(member, Member) else Member.parse_obj(member)
+            if group is None:
+                group = self.groups[group_id] = _own_group(member.group)
+            member.group = group
+            table[member.id] = member
+        self._members[group_id] = table
+        self.stale_groups.discard(group_id)
+
+    def load_friends(self, friends: Iterable[Contact]):
+        self.friends = {
+            friend.id: friend
+            for friend in (f if isinstance(f, Friend) else Friend.parse_obj(f) for f in friends)
+        }
+        self.stale_friends = False
+
+    def invalidate(self):
+        self.stale_group_list = self.stale_friends = True
+        self.stale_groups.update(self._members)
+
+    def apply(self, event: Contact, seq: Optional[int] = None) -> bool:
+        """
+        :param event: 推送帧中的data，或对应的事件模型
+        :param seq: 推送帧的seq，和上一次不连续时视为丢失事件
+        :return: 事件是否改动了roster
+        """
+        if seq is not None:
+            if self.seq is not None and seq != self.seq + 1:
+                self.invalidate()
+            self.seq = seq
+        if isinstance(event, BaseModel):
+            event = event.dict(by_alias=True)
+        handler = handlers.get(event.get("type"))
+        return bool(handler and handler(self, event))
+
+    async def resync(
+            self,
+            fetch_groups: Optional[Callable[[], Awaitable[Iterable[Contact]]]] = None,
+            fetch_members: Optional[Callable[[int], Awaitable[Iterable[Contact]]]] = None,
+            fetch_friends: Optional[Callable[[], Awaitable[Iterable[Contact]]]] = None
+    ) -> int:
+        """
+        只重新拉取被标记为stale的部分，返回拉取次数
+        """
+        fetched = 0
+        if self.stale_group_list and fetch_groups:
+            self.load_groups(await fetch_groups())
+            fetched += 1
+        if fetch_members:
+            for group_id in list(self.stale_groups):
+                if group_id in self.groups:
+                    self.load_members(group_id, await fetch_members(group_id))
+                    fetched += 1
+                else:
+                    self.stale_groups.discard(group_id)
+        if self.stale_friends and fetch_friends:
+            self.load_friends(await fetch_friends())
+            fetched += 1
+        return fetched
+
+    def _drop_group(self, group_id: int):
+        self.groups.pop(group_id, None)
+        self._members.pop(group_id, None)
+        self.stale_groups.discard(group_id)
+
+    def _group(self, event: dict) -> Optional[Group]:
+        data = event.get("group") or event["member"]["group"]
+        return self.groups.get(data["id"])
+
+    def _target(self, event: dict, key: str = "member") -> Optional[Member]:
+        data = event[key]
+        group_id = data["group"]["id"]
+        members = self._members.get(group_id)
+        if members is None:
+            return None
+        member = members.get(data["id"])
+        if member is None:
+            self.stale_groups.add(group_id)
+        return member
+
+    def _set_member(self, event: dict, attr: str, value) -> bool:
+        member = self._target(event)
+        if member is None:
+            return False
+        setattr(member, attr, value)
+        return True
+
+
+def _own_group(group: Contact) -> Group:
+    """
+    roster会原地修改自己的Group，传入的实例可能是member.group这样的interned实例，需要复制一份
+    """
+    return group.copy() if isinstance(group, Group) else Group.parse_obj(group)
+
+
+def _bot_join(roster: Roster, event: dict) -> bool:
+    group = _own_group(event["group"])
+    roster.groups[group.id] = group
+    return True
+
+
+def _bot_leave(roster: Roster, event: dict) -> bool:
+    if event["group"]["id"] not in roster.groups:
+        return False
+    roster._drop_group(event["group"]["id"])
+    return True
+
+
+def _group_attr(attr: str, convert: Callable = lambda v: v):
+    def apply(roster: Roster, event: dict) -> bool:
+        interned_groups.invalidate((event.get("group") or event["member"]["group"])["id"])
+        group = roster._group(event)
+        if group is None:
+            roster.stale_group_list = True
+            return False
+        setattr(group, attr, convert(event["current"]))
+        return True
+    return apply
+
+
+def _member_join(roster: Roster, event: dict) -> bool:
+    data = event["member"]
+    members = roster.members(data["group"]["id"])
+    if members is None:
+        return False
+    member = Member.parse_obj(data)
+    member.group = roster.groups.get(member.group.id, member.group)
+    members[member.id] = member
+    return True
+
+
+def _member_leave(roster: Roster, event: dict) -> bool:
+    data = event["member"]
+    members = roster.members(data["group"]["id"])
+    return bool(members and members.pop(data["id"], None))
+
+
+def _member_attr(attr: str, key: str = "current", convert: Callable = lambda v: v):
+    def apply(roster: Roster, event: dict) -> bool:
+        return roster._set_member(event, attr, convert(event[key]))
+    return apply
+
+
+def _sender(roster: Roster, event: dict) -> bool:
+    """
+    群消息的sender带有最新的群名片和权限，顺便刷新
+    """
+    member = roster._target(event, "sender")
+    if member is None:
+        return False
+    sender = event["sender"]
+    member.memberName = sender["memberName"]
+    member.permission = Permission(sender["permission"])
+    if sender.get("specialTitle") is not None:
+        member.specialTitle = sender["specialTitle"]
+    return True
+
+
+def _friend_nick(roster: Roster, event: dict) -> bool:
+    friend = roster.friends.get(event["friend"]["id"])
+    if friend is None:
+        roster.stale_friends = True
+        return False
+    friend.nickname = event["to"]
+    return True
+
+
+def _gap(roster: Roster, _: dict) -> bool:
+    roster.invalidate()
+    return False
+
+
+handlers: Dict[str, Callable[[Roster, dict], bool]] = {
+    "BotJoinGroupEvent": _bot_join,
+    "BotLeaveEventActive": _bot_leave,
+    "BotLeaveEventKick": _bot_leave,
+    "BotGroupPermissionChangeEvent": _group_attr("permission", Permission),
+    "GroupNameChangeEvent": _group_attr("name"),
+    "MemberJoinEvent": _member_join,
+    "MemberLeaveEventKick": _member_leave,
+    "MemberLeaveEventQuit": _member_leave,
+    "MemberCardChangeEvent": _member_attr("memberName"),
+    "MemberSpecialTitleChangeEvent": _member_attr("specialTitle"),
+    "MemberPermissionChangeEvent": _member_attr("permission", convert=Permission),
+    "MemberMuteEvent": _member_attr("muteTimeRemaining", "durationSeconds"),
+    "MemberUnmuteEvent": lambda roster, event: roster._set_member(event, "muteTimeRemaining", 0),
+    "GroupMessage": _sender,
+    "TempMessage": _sender,
+    "FriendNickChangedEvent": _friend_nick,
+    # 掉线期间的事件都丢失了
+    "BotOfflineEventDropped": _gap,
+    "BotReloginEvent": _gap,
+    "ReplayGap": _gap
+}
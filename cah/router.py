@@ -0,0 +1,50 @@
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Tuple, Type, Union
+
+from pydantic import ValidationError
+
+from .method import BaseSession, Request, StatusCode
+
+if TYPE_CHECKING:
+    from .server import MainServer
+    from .session import Session, SessionStore
+
+Handler = Callable[["MainServer", int, BaseSession], Awaitable[dict]]
+Route = Tuple[Handler, Type[BaseSession]]
+
+
+def error(code: StatusCode, msg: str) -> dict:
+    return {"code": int(code), "msg": msg}
+
+
+class Router:
+    """
+    (command, subCommand) -> (handler, 请求模型)，content在分发前校验为对应模型，
+    sessionKey的检查也在这里完成
+    """
+
+    def __init__(self):
+        self.routes: Dict[Tuple[str, Optional[str]], Route] = {}
+
+    def __contains__(self, command: str):
+        return (command, None) in self.routes
+
+    def route(self, command: str, model: Type[BaseSession] = BaseSession, sub_command: Optional[str] = None):
+        def decorator(handler: Handler) -> Handler:
+            self.routes[(command, sub_command)] = (handler, model)
+            return handler
+        return decorator
+
+    def resolve(self, req: Request, sessions: "SessionStore") \
+            -> Union[Tuple[Handler, BaseSession, "Session"], dict]:
+        route = self.routes.get((req.command, req.subCommand))
+        if not route:
+            return error(StatusCode.UnknownCommand, f"unknown command: {req.command}")
+        handler, model = route
+        session = sessions.get(req.content.get("sessionKey"))
+        if not session:
+            return error(StatusCode.InvalidSession, "invalid session key")
+        try:
+            payload = model.parse_obj(req.content)
+        except ValidationError as e:
+            return error(StatusCode.BadRequest, str(e))
+        return handler, payload, session
@@ -1,69 +1,234 @@
 import asyncio
 import os
+import time
 
 from aiohttp import web
 
-from typing import TYPE_CHECKING, Dict, List, Optional
-from .decoder import handlers
-from .method import Request, Response
+from typing import TYPE_CHECKING, Awaitable, Dict, FrozenSet, List, Optional, Set, Union
+from .cache import MessageCache
+from .connection import Connection, OverflowPolicy
+from .decoder import router
+from .encoder import JsonCodec, set_default_codec
+from .filter import EVENT_TYPES, MESSAGE_TYPES, filter_from_query
+from .journal import Journal, KIND_EVENT
+from .message.chain import CacheMessage, LazyMessageChain, MessageChain
+from .message.models import Source
+from .metrics import Metrics, utf8_len
+from .method import Request, Response, StatusCode
+from .monitor import LoopMonitor
+from .replay import ReplayRing, parse_resume
+from .roster import Roster
+from .router import error
+from .session import Session, SessionStore
+from .worker import Cluster
 
 if TYPE_CHECKING:
     from aiohttp.client_ws import WSMessage
 
 
 class MainServer:
-    def __init__(self, dispatcher, verify_key="TestOnly"):
+    def __init__(
+            self,
+            dispatcher,
+            verify_key="TestOnly",
+            queue_size: int = 1024,
+            overflow_policy: OverflowPolicy = OverflowPolicy.DropOldest,
+            codec: Union[str, JsonCodec, None] = None,
+            max_inflight: int = 32,
+            cache_entries: int = 4096,
+            cache_bytes: int = 16 * 1024 * 1024,
+            journal_path: Optional[str] = None,
+            journal_options: Optional[dict] = None,
+            replay_size: int = 1024,
+            session_ttl: Optional[float] = None,
+            monitor: Optional[LoopMonitor] = None
+    ):
         self.dispatcher = dispatcher
+        self.codec = set_default_codec(codec)
         self.app = web.Application()
         self._verify_key = verify_key
-        self.sessions: Dict[str, int] = {}
-        self._ws_bound: Dict[int, List[web.WebSocketResponse]] = {}
+        self._queue_size = queue_size
+        self._overflow_policy = OverflowPolicy(overflow_policy)
+        self._max_inflight = max_inflight
+        self._cache_limits = (cache_entries, cache_bytes)
+        self.caches: Dict[int, MessageCache] = {}
+        self._journal_path = journal_path
+        self._journal_options = journal_options or {}
+        self._replay_size = replay_size
+        self.rings: Dict[int, ReplayRing] = {}
+        self.rosters: Dict[int, Roster] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.cluster: Optional[Cluster] = None
+        self.sessions = SessionStore(session_ttl, on_expire=self._on_session_expire)
+        self.monitor = monitor or LoopMonitor()
+        self.metrics = Metrics({command for command, _ in router.routes}, ("/all", "/message", "/event"))
 
     async def emit(self, qq: int, data: dict):
-        for ws in self._ws_bound[qq]:
-            await ws.send_json(data)
-
-    async def task(self, ws: web.WebSocketResponse):
-        count = 0
-        await asyncio.sleep(1)
-        while True:
-            if count > 40000:
-                print("done")
-                break
-            else:
-                count += 1
-            await ws.send_json(
-                {
-                    "syncId": "-1",
-                    "data": {
-                        "type": "GroupMessage",
-                        "messageChain": [{"type": "Plain", "text": "老阿姨"}],
-                        "sender": {
-                            "id": 1,
-                            "memberName": "?",
-                            "permission": "MEMBER",
-                            "group": {
-                                "id": 2,
-                                "name": "??",
-                                "permission": "MEMBER"
-                            }
-                        }
-                    }
-                }
-            )
-            #await asyncio.sleep(0.01)
+        if self.cluster and not self.cluster.owns(qq):
+            self.cluster.forward(qq, data)
+        else:
+            self.publish(qq, data)
+
+    def publish(self, qq: int, data: dict):
+        ring = self.get_ring(qq)
+        data = dict(data, seq=ring.seq + 1)
+        entry = ring.push(data)
+        event = data.get("data", {})
+        source_id = self._observe(qq, event, entry[0])
+        if self.cluster:
+            self.cluster.fanout(qq, data)
+        targets = [s.conn for s in self.sessions.bound(qq).values() if s.conn and s.conn.accepts(data)]
+        if not (targets or self._journal_path or source_id is not None):
+            return
+        token = self.monitor.begin("push", event.get("type", ""), str(entry[0]))
+        try:
+            self._send(qq, data, entry, source_id, targets)
+        finally:
+            self.monitor.end(token)
+
+    def deliver(self, qq: int, data: dict):
+        """
+        投递owner worker已经编号过的帧
+        """
+        entry = self.get_ring(qq).record(data)
+        source_id = self._observe(qq, data.get("data", {}), entry[0])
+        targets = [s.conn for s in self.sessions.bound(qq).values() if s.conn and s.conn.accepts(data)]
+        if targets or self._journal_path or source_id is not None:
+            self._send(qq, data, entry, source_id, targets)
+
+    def _observe(self, qq: int, event: dict, seq: int) -> Optional[int]:
+        """
+        更新roster，返回可以被引用的消息的Source.id
+        """
+        roster = self.rosters.get(qq)
+        if roster:
+            roster.apply(event, seq)
+        if event.get("type") in MESSAGE_TYPES:
+            return _source_id(event.get("messageChain"))
+
+    def _send(self, qq: int, data: dict, entry: list, source_id: Optional[int], targets: List[Connection]):
+        """
+        帧只编码一次，同一个字符串发给所有连接；journal只写这一条事件帧(消息以Source.id为key)，
+        消息以原始元素列表存入缓存，之后客户端可以按Source.id引用(quote、messageFromId)
+        """
+        frame = entry[2] = self.codec.dumps(data)
+        cache = self.get_cache(qq) if self._journal_path or source_id is not None else None
+        if self._journal_path:
+            raw = frame.encode()
+            size = len(raw)
+            cache.journal.append(KIND_EVENT, raw, source_id)
+        else:
+            size = utf8_len(frame)
+        if source_id is not None:
+            event = data["data"]
+            chain = event["messageChain"]
+            if not isinstance(chain, MessageChain):
+                chain = LazyMessageChain.from_raw(chain)
+            cache.remember(source_id, CacheMessage.construct(type=event["type"], messageChain=chain), size)
+        for conn in targets:
+            conn.send(frame, size=size)
+
+    def broadcast(self, qq: int, frame: str):
+        size = utf8_len(frame)
+        for session in self.sessions.bound(qq).values():
+            if session.conn:
+                session.conn.send(frame, size=size)
+
+    def _on_session_expire(self, session: Session):
+        if session.conn:
+            asyncio.create_task(session.conn.close())
+
+    def revoke(self, qq: int) -> int:
+        if self.cluster:
+            self.cluster.revoke(qq)
+        return len(self.sessions.revoke(qq))
+
+    def get_ring(self, qq: int) -> ReplayRing:
+        ring = self.rings.get(qq)
+        if ring is None:
+            ring = self.rings[qq] = ReplayRing(self._replay_size, not self.cluster or self.cluster.owns(qq))
+        return ring
+
+    def get_roster(self, qq: int) -> Roster:
+        """
+        在本worker看到的推送上维护的roster，需要先load_groups/load_members
+        """
+        roster = self.rosters.get(qq)
+        if roster is None:
+            roster = self.rosters[qq] = Roster()
+        return roster
+
+    def get_cache(self, qq: int) -> MessageCache:
+        cache = self.caches.get(qq)
+        if cache is None:
+            journal = None
+            if self._journal_path:
+                # 多进程时每个worker各用一个目录，Journal不支持多个写入者
+                base = self._journal_path
+                if self.cluster:
+                    base = os.path.join(base, f"worker-{self.cluster.index}")
+                journal = Journal(
+                    os.path.join(base, str(qq)),
+                    codec=self.codec,
+                    **self._journal_options
+                )
+            cache = self.caches[qq] = MessageCache(*self._cache_limits, journal=journal)
+        return cache
+
+    def queue_stats(self, qq: int) -> List[dict]:
+        return [
+            {"depth": s.conn.depth, "dropped": s.conn.dropped, "sent": s.conn.sent, **s.info()}
+            for s in self.sessions.bound(qq).values() if s.conn
+        ]
 
     def register(self):
         self.app.add_routes([
             web.get("/all", self.listen_all),
-            web.get("/message", self.listen_all),
-            web.get("/event", self.blocker)
+            web.get("/message", self.listen_message),
+            web.get("/event", self.listen_event),
+            web.get("/metrics", self.export_metrics),
+            web.get("/admin/monitor", self.export_monitor)
         ])
+        self.app.on_startup.append(self._on_startup)
+        self.app.on_shutdown.append(self._on_shutdown)
+        self.app.on_cleanup.append(self._on_cleanup)
 
-    async def blocker(self, request: web.Request):
-        ws = await self._verify_and_prepare(request)
-        async for msg in ws:
-            pass
+    async def _on_startup(self, _: web.Application):
+        self.monitor.start()
+        if self.cluster:
+            self.sessions.resolver = self.cluster.verify
+            await self.cluster.start(self)
+
+    async def _on_shutdown(self, _: web.Application):
+        conns = [s.conn for _, bound in self.sessions.bots() for s in bound.values() if s.conn]
+        await asyncio.gather(*(conn.close() for conn in conns), return_exceptions=True)
+
+    async def _on_cleanup(self, _: web.Application):
+        self.monitor.stop()
+        self.sessions.close()
+        for cache in self.caches.values():
+            if cache.journal:
+                cache.journal.close()
+        if self.cluster:
+            await self.cluster.close()
+
+    async def export_monitor(self, request: web.Request):
+        if request.query.get("verifyKey") != self._verify_key:
+            raise web.HTTPForbidden()
+        return web.json_response(self.monitor.snapshot(), dumps=self.codec.dumps)
+
+    async def export_metrics(self, request: web.Request):
+        return web.Response(
+            text=self.metrics.render(self.sessions, self.monitor),
+            content_type="text/plain",
+            headers={"X-Prometheus-Version": "0.0.4"}
+        )
+
+    async def listen_message(self, request: web.Request):
+        return await self.listen_all(request, MESSAGE_TYPES)
+
+    async def listen_event(self, request: web.Request):
+        return await self.listen_all(request, EVENT_TYPES)
 
     async def _verify_and_prepare(self, request: web.Request) -> Optional[web.WebSocketResponse]:
         ws = web.WebSocketResponse(autoping=False, autoclose=True)
@@ -73,49 +238,184 @@ class MainServer:
             await ws.prepare(request)
             return ws
 
-    async def receiver(self, ws: web.WebSocketResponse):
-        async for msg in ws:  # type: WSMessage
-            if msg.type == web.WSMsgType.TEXT:
-                req = Request.parse_obj(msg.json())  # type: Request
-                if req.syncId and req.content["sessionKey"] in self.sessions:
-                    if req.command in handlers:
-                        await ws.send_json(
-                            Response(
-                                syncId=req.syncId,
-                                data=await handlers[req.command](req.content)
-                            ).dict()
-                        )
-            elif msg.type == web.WSMsgType.PING:
-                await ws.pong()
-            elif msg.type == web.WSMsgType.CLOSE:
-                break
-
-    async def listen_all(self, request: web.Request):
+    def reply(self, conn: Connection, sync_id: str, data: dict):
+        conn.send(self.codec.dump_model(Response(syncId=sync_id, data=data)), droppable=False)
+
+    @staticmethod
+    async def _resolved(data: dict) -> dict:
+        return data
+
+    async def execute(
+            self,
+            conn: Connection,
+            req: Request,
+            call: Awaitable[dict],
+            previous: Optional[asyncio.Task] = None
+    ):
+        token = self.monitor.begin("command", req.command, req.syncId)
+        start = time.perf_counter()
+        try:
+            data = await call
+        except Exception as e:
+            data = error(StatusCode.InternalError, repr(e))
+        finally:
+            # 客户端断开时in-flight的task会被cancel，也要结束计时
+            self.monitor.end(token)
+        histogram = self.metrics.commands.get(req.command)
+        if histogram:
+            histogram.observe(time.perf_counter() - start)
+        if previous:
+            await asyncio.wait((previous,))
+        self.reply(conn, req.syncId, data)
+
+    async def receiver(self, conn: Connection, ordered: bool = False, session: Optional[Session] = None):
+        """
+        :param session: 连接自己的session，收到任何帧(包括PING)都刷新其空闲时间
+        """
+        ws, stats = conn.ws, conn.stats
+        limit = asyncio.Semaphore(self._max_inflight)
+        pending: Set[asyncio.Task] = set()
+        last: Optional[asyncio.Task] = None
+
+        def done(task: asyncio.Task):
+            pending.discard(task)
+            limit.release()
+
+        try:
+            async for msg in ws:  # type: WSMessage
+                if session:
+                    session.touch()
+                if msg.type == web.WSMsgType.TEXT:
+                    stats.frames_in += 1
+                    stats.bytes_in += utf8_len(msg.data)
+                    try:
+                        req = Request.parse_obj(msg.json(loads=self.codec.loads))  # type: Request
+                    except (ValueError, TypeError):
+                        continue
+                    resolved = router.resolve(req, self.sessions)
+                    if isinstance(resolved, dict):
+                        if not (ordered and last):
+                            self.reply(conn, req.syncId, resolved)
+                            continue
+                        call = self._resolved(resolved)
+                    else:
+                        handler, payload, caller = resolved
+                        caller.touch(True)
+                        call = handler(self, caller.qq, payload)
+                    await limit.acquire()
+                    last = asyncio.create_task(self.execute(conn, req, call, last if ordered else None))
+                    last.add_done_callback(done)
+                    pending.add(last)
+                elif msg.type == web.WSMsgType.PING:
+                    await ws.pong()
+                elif msg.type == web.WSMsgType.CLOSE:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def listen_all(self, request: web.Request, default_types: Optional[FrozenSet[str]] = None):
+        # 参数在握手前解析，格式错误时返回400而不是在升级之后断开
+        try:
+            qq = int(request.query.get("qq"))
+            accepts = filter_from_query(request.query, default_types)
+        except (TypeError, ValueError):
+            self.metrics.handshake_failures += 1
+            return web.HTTPBadRequest()
         ws = await self._verify_and_prepare(request)
         if ws == None:
+            self.metrics.handshake_failures += 1
             return web.HTTPBadRequest()
-        verify_key, qq, session = (
-            request.query.get("verifyKey"),
-            int(request.query.get("qq")),
-            os.urandom(16).hex()
+        conn = Connection(
+            ws,
+            self._queue_size,
+            self._overflow_policy,
+            accepts,
+            self.metrics.route(request.path)
         )
-        self.sessions[session] = qq
-        if qq in self._ws_bound:
-            self._ws_bound[qq].append(ws)
+        if self.cluster:
+            key = self.cluster.issue(qq)
+            self.cluster.open(qq, key)
         else:
-            self._ws_bound[qq] = [ws]
-        await ws.send_json({"syncId": 0, "data": {"code": 0, "session": session}})
-        asyncio.create_task(self.task(ws))
+            key = os.urandom(16).hex()
+        session: Optional[Session] = None
+        # open之后的任何失败(包括握手回复时客户端断开)都要广播close，否则key在所有worker上一直有效
         try:
-            await self.receiver(ws)
+            await ws.send_str(self.codec.dumps({"syncId": 0, "data": {"code": 0, "session": key}}))
+            resume_from = parse_resume(request.query.get("resumeFrom"))
+            if resume_from is not None:
+                for frame in self.get_ring(qq).replay(resume_from, conn.accepts, self.codec.dumps):
+                    conn.send(frame, droppable=False)
+            session = self.sessions.create(qq, conn, key)
+            if self.cluster:
+                self.cluster.subscribe(qq)
+            conn.start()
+            await self.receiver(conn, request.query.get("ordered", "").lower() in ("1", "true"), session)
         finally:
-            self.sessions.pop(session)
-            self._ws_bound[qq].remove(ws)
-        print("done!！")
+            if session:
+                self.sessions.remove(key)
+            if self.cluster:
+                self.cluster.close_key(qq, key)
+                if session:
+                    self.cluster.unsubscribe(qq)
+            await conn.close()
+        return ws
 
-    async def _run(self, port, host):
+    async def start(
+            self,
+            port: int,
+            host: str = "0.0.0.0",
+            backlog: int = 128,
+            reuse_port: Optional[bool] = None
+    ) -> web.AppRunner:
         self.register()
-        await web._run_app(self.app, host=host, port=port)
+        self._runner = web.AppRunner(self.app, handle_signals=False)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port, backlog=backlog, reuse_port=reuse_port).start()
+        return self._runner
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _run(self, port, host, backlog, reuse_port):
+        await self.start(port, host, backlog, reuse_port)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    def run(
+            self,
+            port: int,
+            host="0.0.0.0",
+            backlog: int = 128,
+            reuse_port: Optional[bool] = None,
+            use_uvloop: bool = True
+    ):
+        """
+        :param backlog: listen()的连接队列长度
+        :param reuse_port: 设置SO_REUSEPORT，多个进程可以监听同一端口
+        :param use_uvloop: 安装了uvloop时使用uvloop的事件循环
+        """
+        if use_uvloop:
+            try:
+                import uvloop
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            except ImportError:
+                pass
+        try:
+            asyncio.run(self._run(port, host, backlog, reuse_port))
+        except KeyboardInterrupt:
+            pass
+
 
-    def run(self, port: int, host="0.0.0.0"):
-        asyncio.run(self._run(port, host))
+def _source_id(chain) -> Optional[int]:
+    if isinstance(chain, MessageChain):
+        source = chain.get_source()
+        return source.id if source else None
+    head = chain[0] if chain else None
+    if isinstance(head, dict):
+        return head.get("id") if head.get("type") == "Source" else None
+    return head.id if isinstance(head, Source) else None
@@ -0,0 +1,144 @@
+import asyncio
+import math
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .connection import Connection
+
+
+class Session:
+    __slots__ = ("key", "qq", "conn", "created", "last_seen", "commands")
+
+    def __init__(self, key: str, qq: int, conn: Optional[Connection]):
+        self.key = key
+        self.qq = qq
+        self.conn = conn
+        self.created = time.time()
+        self.last_seen = time.monotonic()
+        self.commands = 0
+
+    def touch(self, command: bool = False):
+        self.last_seen = time.monotonic()
+        if command:
+            self.commands += 1
+
+    def info(self) -> dict:
+        return {
+            "qq": self.qq,
+            "created": self.created,
+            "idle": time.monotonic() - self.last_seen,
+            "commands": self.commands
+        }
+
+
+class SessionStore:
+    """
+    sessionKey -> Session，附带qq -> sessions的反向索引；
+    设置ttl时由单个时间轮task按空闲时间淘汰，touch只更新时间戳，
+    到期时再按last_seen重新挂到对应的槽上；连接还开着的session不会被淘汰，
+    ttl实际约束的是其他worker签发、在本地登记的不带连接的session
+    """
+
+    def __init__(
+            self,
+            ttl: Optional[float] = None,
+            tick: float = 1.0,
+            on_expire: Optional[Callable[[Session], None]] = None
+    ):
+        self.ttl = ttl
+        self.tick = tick
+        self.on_expire = on_expire
+        self.resolver: Optional[Callable[[str], Optional[int]]] = None
+        self._sessions: Dict[str, Session] = {}
+        self._by_qq: Dict[int, Dict[str, Session]] = {}
+        self._wheel: List[Set[str]] = [set() for _ in range(math.ceil(ttl / tick) + 1)] if ttl else []
+        self._cursor = 0
+        self._timer: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key: str):
+        return key in self._sessions
+
+    def get(self, key: Optional[str]) -> Optional[Session]:
+        session = self._sessions.get(key)
+        if session is None and key and self.resolver:
+            # 其他worker签发的sessionKey，校验通过后在本地登记一个不带连接的session，
+            # 签发的worker广播close时移除
+            qq = self.resolver(key)
+            if qq is not None:
+                session = self.create(qq, None, key)
+        return session
+
+    def bound(self, qq: int) -> Dict[str, Session]:
+        return self._by_qq.get(qq, {})
+
+    def bots(self) -> Iterable[Tuple[int, Dict[str, Session]]]:
+        return self._by_qq.items()
+
+    def count(self, qq: int) -> int:
+        return len(self._by_qq.get(qq, ()))
+
+    def create(self, qq: int, conn: Optional[Connection] = None, key: Optional[str] = None) -> Session:
+        session = Session(key or os.urandom(16).hex(), qq, conn)
+        self._sessions[session.key] = session
+        if qq in self._by_qq:
+            self._by_qq[qq][session.key] = session
+        else:
+            self._by_qq[qq] = {session.key: session}
+        if self._wheel:
+            self._schedule(session.key, self.ttl)
+            if not self._timer:
+                self._timer = asyncio.create_task(self._run_wheel())
+        return session
+
+    def remove(self, key: str) -> Optional[Session]:
+        session = self._sessions.pop(key, None)
+        if session:
+            bound = self._by_qq[session.qq]
+            del bound[key]
+            if not bound:
+                del self._by_qq[session.qq]
+        return session
+
+    def revoke(self, qq: int) -> List[Session]:
+        revoked = [self.remove(key) for key in list(self._by_qq.get(qq, ()))]
+        if self.on_expire:
+            for session in revoked:
+                self.on_expire(session)
+        return revoked
+
+    def _schedule(self, key: str, delay: float):
+        ticks = min(max(math.ceil(delay / self.tick), 1), len(self._wheel) - 1)
+        self._wheel[(self._cursor + ticks) % len(self._wheel)].add(key)
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % len(self._wheel)
+        due, self._wheel[self._cursor] = self._wheel[self._cursor], set()
+        now = time.monotonic()
+        for key in due:
+            session = self._sessions.get(key)
+            if not session:
+                continue
+            remaining = self.ttl - (now - session.last_seen)
+            if remaining > 0:
+                self._schedule(key, remaining)
+            elif session.conn and not session.conn.closed:
+                # 只收推送的客户端可能很久不发帧，连接关闭时由listen_all移除
+                self._schedule(key, self.ttl)
+            else:
+                self.remove(key)
+                if self.on_expire:
+                    self.on_expire(session)
+
+    async def _run_wheel(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self._advance()
+
+    def close(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
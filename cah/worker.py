@@ -0,0 +1,243 @@
+import asyncio
+import hmac
+import os
+import shutil
+import signal
+import struct
+import tempfile
+import time
+import traceback
+from hashlib import sha256
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set, Union
+
+from .encoder import JsonCodec, get_codec
+
+if TYPE_CHECKING:
+    from .server import MainServer
+
+LENGTH = struct.Struct(">I")
+
+
+class Cluster:
+    """
+    多进程模式下单个worker的视图：bot按qq % size分片到owner worker，
+    事件先转发给owner统一编号，再由owner推给订阅了该qq的worker；
+    sessionKey带HMAC签名，签发的worker在连接建立/断开时广播open/close，
+    只有签名正确且连接仍在的key才能通过校验。
+    每个worker使用自己的journal目录，消息缓存也是各自的，
+    worker只能查到自己收到或推送过的消息
+    """
+
+    def __init__(
+            self,
+            index: int,
+            size: int,
+            ipc_dir: str,
+            secret: bytes,
+            codec: Union[str, JsonCodec, None] = None
+    ):
+        self.index = index
+        self.size = size
+        self.ipc_dir = ipc_dir
+        self.codec = get_codec(codec)
+        self._secret = secret
+        self._revoked: Dict[int, int] = {}
+        # 连接仍然存在的sessionKey -> qq
+        self._live: Dict[str, int] = {}
+        self._subscribers: Dict[int, Set[int]] = {}
+        self._local: Dict[int, int] = {}
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._handlers: Set[asyncio.Task] = set()
+        self._backlog: Dict[int, List[bytes]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.app: Optional["MainServer"] = None
+
+    def path(self, index: int) -> str:
+        return os.path.join(self.ipc_dir, f"worker-{index}.sock")
+
+    def owner(self, qq: int) -> int:
+        return qq % self.size
+
+    def owns(self, qq: int) -> bool:
+        return qq % self.size == self.index
+
+    def _sign(self, body: str) -> str:
+        return hmac.new(self._secret, body.encode(), sha256).hexdigest()[:32]
+
+    def issue(self, qq: int) -> str:
+        body = f"{qq:x}-{int(time.time() * 1000):x}-{os.urandom(8).hex()}"
+        return f"{body}-{self._sign(body)}"
+
+    def verify(self, key: str) -> Optional[int]:
+        body, _, mac = key.rpartition("-")
+        parts = body.split("-")
+        if len(parts) != 3 or not hmac.compare_digest(self._sign(body), mac):
+            return None
+        try:
+            qq, issued = int(parts[0], 16), int(parts[1], 16)
+        except ValueError:
+            return None
+        if issued >= self._revoked.get(qq, 0) and self._live.get(key) == qq:
+            return qq
+
+    def open(self, qq: int, key: str):
+        self._live[key] = qq
+        self.broadcast({"op": "open", "qq": qq, "key": key})
+
+    def close_key(self, qq: int, key: str):
+        self._live.pop(key, None)
+        self.broadcast({"op": "close", "qq": qq, "key": key})
+
+    def _forget(self, qq: int):
+        for key in [key for key, owner in self._live.items() if owner == qq]:
+            del self._live[key]
+
+    def revoke(self, qq: int):
+        before = int(time.time() * 1000) + 1
+        self._revoked[qq] = before
+        self._forget(qq)
+        self.broadcast({"op": "revoke", "qq": qq, "before": before})
+
+    async def start(self, app: "MainServer"):
+        self.app = app
+        path = self.path(self.index)
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = await asyncio.start_unix_server(self._handle, path)
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+        for writer in self._writers.values():
+            writer.close()
+        for task in self._handlers:
+            task.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                length, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                self._dispatch(self.codec.loads(await reader.readexactly(length)))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    def _dispatch(self, msg: dict):
+        op, qq = msg["op"], msg["qq"]
+        if op == "emit":
+            self.app.publish(qq, msg["data"])
+        elif op == "deliver":
+            self.app.deliver(qq, msg["data"])
+        elif op == "sub":
+            self._subscribers.setdefault(qq, set()).add(msg["worker"])
+        elif op == "unsub":
+            self._subscribers.get(qq, set()).discard(msg["worker"])
+        elif op == "open":
+            self._live[msg["key"]] = qq
+        elif op == "close":
+            self._live.pop(msg["key"], None)
+            self.app.sessions.remove(msg["key"])
+        elif op == "revoke":
+            self._revoked[qq] = msg["before"]
+            self._forget(qq)
+            self.app.sessions.revoke(qq)
+
+    def send(self, peer: int, msg: dict):
+        data = self.codec.dumps(msg).encode()
+        frame = LENGTH.pack(len(data)) + data
+        writer = self._writers.get(peer)
+        if writer:
+            writer.write(frame)
+        elif peer in self._backlog:
+            self._backlog[peer].append(frame)
+        else:
+            self._backlog[peer] = [frame]
+            asyncio.create_task(self._connect(peer))
+
+    async def _connect(self, peer: int, retries: int = 50):
+        for _ in range(retries):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path(peer))
+                break
+            except (FileNotFoundError, ConnectionError):
+                await asyncio.sleep(0.1)
+        else:
+            self._backlog.pop(peer, None)
+            return
+        self._writers[peer] = writer
+        for frame in self._backlog.pop(peer, ()):
+            writer.write(frame)
+
+    def broadcast(self, msg: dict):
+        for peer in range(self.size):
+            if peer != self.index:
+                self.send(peer, msg)
+
+    def forward(self, qq: int, data: dict):
+        self.send(self.owner(qq), {"op": "emit", "qq": qq, "data": data})
+
+    def fanout(self, qq: int, data: dict):
+        for peer in self._subscribers.get(qq, ()):
+            self.send(peer, {"op": "deliver", "qq": qq, "data": data})
+
+    def subscribe(self, qq: int):
+        count = self._local[qq] = self._local.get(qq, 0) + 1
+        if count == 1 and not self.owns(qq):
+            self.send(self.owner(qq), {"op": "sub", "qq": qq, "worker": self.index})
+
+    def unsubscribe(self, qq: int):
+        count = self._local[qq] = self._local.get(qq, 1) - 1
+        if not count:
+            del self._local[qq]
+            if not self.owns(qq):
+                self.send(self.owner(qq), {"op": "unsub", "qq": qq, "worker": self.index})
+
+
+def run_workers(
+        factory: Callable[[], "MainServer"],
+        workers: int,
+        port: int,
+        host: str = "0.0.0.0",
+        **kwargs
+):
+    """
+    fork出workers个进程，通过SO_REUSEPORT共享监听端口，进程间用unix socket通信
+
+    :param factory: 在子进程内创建MainServer
+    :param kwargs: 传给MainServer.run
+    """
+    ipc_dir = tempfile.mkdtemp(prefix="cah-")
+    secret = os.urandom(32)
+    pids = []
+    try:
+        for index in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                code = 0
+                try:
+                    server = factory()
+                    server.cluster = Cluster(index, workers, ipc_dir, secret, server.codec)
+                    server.run(port, host, reuse_port=True, **kwargs)
+                except BaseException:
+                    traceback.print_exc()
+                    code = 1
+                finally:
+                    os._exit(code)
+            pids.append(pid)
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except KeyboardInterrupt:
+                for child in pids:
+                    try:
+                        os.kill(child, signal.SIGINT)
+                    except ProcessLookupError:
+                        pass
+                os.waitpid(pid, 0)
+    finally:
+        shutil.rmtree(ipc_dir, ignore_errors=True)
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import os
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from cah.component.download import DownloadManager, FileMismatchError
+
+PART_SIZE = 64 * 1024
+
+
+class StandIn:
+    """
+    本地的群文件下载服务，记录收到的GET请求的Range，可以让指定的Range失败若干次
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ranges = []
+        self.failures = {}
+        self.runner = None
+        self.url = None
+
+    async def serve(self, request: web.Request):
+        if request.method == "GET":
+            value = request.headers.get("Range")
+            self.ranges.append(value)
+            if self.failures.get(value):
+                self.failures[value] -= 1
+                raise web.HTTPInternalServerError()
+        return web.FileResponse(self.path)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/file", self.serve)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/file"
+        return self
+
+    async def __aexit__(self, *_):
+        await self.runner.cleanup()
+
+
+@pytest.fixture
+def source(tmp_path):
+    data = os.urandom(5 * PART_SIZE + 123)
+    path = tmp_path / "source.bin"
+    path.write_bytes(data)
+    return str(path), data, hashlib.sha1(data).hexdigest()
+
+
+def manager() -> DownloadManager:
+    return DownloadManager(concurrency=2, part_size=PART_SIZE, split_threshold=2 * PART_SIZE)
+
+
+def test_resume_after_failed_range(tmp_path, source):
+    path, data, sha1 = source
+    save_path = str(tmp_path / "out.bin")
+    failed = f"bytes={2 * PART_SIZE}-{3 * PART_SIZE - 1}"
+
+    async def run():
+        async with StandIn(path) as server:
+            downloads = manager()
+            server.failures[failed] = 1
+            with pytest.raises(aiohttp.ClientResponseError):
+                await downloads.download(server.url, save_path, sha1)
+            assert not os.path.exists(save_path)
+            assert os.path.exists(save_path + ".part.json")
+
+            server.ranges.clear()
+            assert await downloads.download(server.url, save_path, sha1) == save_path
+            await downloads.close()
+            return server.ranges
+
+    assert asyncio.run(run()) == [failed]
+    with open(save_path, "rb") as f:
+        assert f.read() == data
+    assert not os.path.exists(save_path + ".part")
+    assert not os.path.exists(save_path + ".part.json")
+
+
+def test_verified_sha1_is_cached(tmp_path, source):
+    path, data, sha1 = source
+    save_path = str(tmp_path / "out.bin")
+
+    async def run():
+        async with StandIn(path) as server:
+            downloads = manager()
+            await downloads.download(server.url, save_path, sha1.upper())
+            server.ranges.clear()
+            await downloads.download(server.url, save_path, sha1)
+            await downloads.close()
+            return server.ranges
+
+    assert asyncio.run(run()) == []
+    with open(save_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_sha1_mismatch(tmp_path, source):
+    path, _, sha1 = source
+    save_path = str(tmp_path / "out.bin")
+
+    async def run():
+        async with StandIn(path) as server:
+            downloads = manager()
+            try:
+                await downloads.download(server.url, save_path, "0" * 40)
+            finally:
+                await downloads.close()
+
+    with pytest.raises(FileMismatchError) as info:
+        asyncio.run(run())
+    assert (info.value.expected, info.value.actual) == ("0" * 40, sha1)
+    assert sorted(os.listdir(tmp_path)) == ["source.bin"]